@@ -0,0 +1,325 @@
+"""Micro-benchmarks for the bot's hot paths, without a Discord connection.
+
+Run from the repository root:
+
+    python -m benchmarks.hot_paths [--rounds 2000] [--only help,errors] [--save] [--compare] [--tolerance 1.3] [--floor 5]
+
+The real client from harper.lib.bot is set up with every cog loaded and a
+temporary SQLite database, then driven with fake messages, guilds and contexts.
+Sends are collected in memory instead of going to Discord.
+
+--save writes the results to benchmarks/baseline.json. --compare checks the
+current run against that baseline and exits non-zero when any case's median
+is slower than the baseline median times the tolerance, ignoring differences
+under --floor microseconds that are within timer noise for the fastest cases.
+"""
+
+# 3rd party modules
+import discord
+from discord.ext import commands
+
+# Builtin modules
+import sys
+import json
+import asyncio
+import platform
+import tempfile
+from os import path
+from itertools import count
+from statistics import median
+from datetime import datetime
+from time import perf_counter
+from argparse import ArgumentParser
+
+# Local modules
+from harper.lib.utils.dispatch import Dispatcher
+
+BASELINE = path.join(path.dirname(__file__), 'baseline.json')
+
+GUILDS = 200
+CUSTOM_PREFIXES = 50
+BOT_ID = 1000
+
+
+class FakeUser(object):
+    """Just enough of discord.User for the bot's own user and message authors"""
+
+    bot = False
+
+    def __init__(self, user_id, name='user'):
+        self.id = user_id
+        self.name = f"{name}{user_id}"
+        self.discriminator = '0001'
+        self.mention = f"<@!{user_id}>"
+        self.avatar_url = f"https://cdn.discordapp.com/embed/avatars/{user_id % 5}.png"
+        self.colour = discord.Colour(0x3498DB)
+
+
+class FakeGuild(object):
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.me = FakeUser(BOT_ID)
+
+
+class FakeChannel(object):
+    """A text channel whose sends are kept in memory"""
+
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+    async def trigger_typing(self):
+        pass
+
+
+class FakeMessage(object):
+
+    _state = None
+
+    def __init__(self, message_id, content, author, channel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.attachments = []
+        self.mentions = []
+        self.created_at = datetime.utcnow()
+
+    async def add_reaction(self, emoji):
+        pass
+
+
+class FakeContext(object):
+    """The parts of commands.Context used by the help command and the error handler"""
+
+    def __init__(self, message, command=None):
+        self.message = message
+        self.author = message.author
+        self.channel = message.channel
+        self.guild = message.guild
+        self.command = command
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class Fixtures(object):
+    """Fake guilds, channels and authors shared by every case"""
+
+    def __init__(self):
+        self.ids = count(10**6)
+        self.guilds = [FakeGuild(i + 1) for i in range(GUILDS)]
+        self.channels = [FakeChannel(10**5 + guild.id, guild) for guild in self.guilds]
+
+    def author(self):
+        return FakeUser(next(self.ids))
+
+    def message(self, i, content, author=None):
+        return FakeMessage(next(self.ids), content, author or self.author(), self.channels[i % GUILDS])
+
+
+async def connect(bot, directory):
+    """Point the client at a temporary database with some custom prefixes"""
+
+    bot.DB_PATH = path.join(directory, 'database.db')
+    await bot.connect_db()
+
+    for guild_id in range(1, CUSTOM_PREFIXES + 1):
+        await bot.client.db.execute('INSERT INTO prefixes (id, prefix) VALUES (?, ?)', (guild_id, f"p{guild_id}!"))
+    await bot.client.prefixes.load(bot.client.db)
+
+
+def cases(bot, fixtures):
+    """Benchmark name mapped to an async callable taking the round number"""
+
+    client = bot.client
+    meta = client.get_cog('Meta')
+    errors = client.get_cog('Errors')
+    homework = sys.modules['harper.lib.cogs.homework']
+    quadratics = client.get_command('quadratics')
+
+    async def get_prefix(i):
+        await bot.get_prefix(client, fixtures.message(i, 'hello'))
+
+    async def guild_prefix(i):
+        await client.prefix(fixtures.message(i, 'hello'))
+
+    async def guild_prefix_db(i):
+        # Every lookup misses the cache and goes to SQLite
+        client.prefixes.clear()
+        client.prefixes.complete = False
+        await client.prefix(fixtures.message(i, 'hello'))
+
+    async def mention_prefix(i):
+        # A new author each time, so the cooldown never trips and the prefix reply is built
+        await bot.on_message(fixtures.message(i, f"<@!{BOT_ID}>"))
+
+    async def chatter(i):
+        # Ordinary conversation, rejected before process_commands
+        await bot.on_message(fixtures.message(i, 'did anyone finish the worksheet?'))
+
+    author = fixtures.author()
+
+    async def mention_cooldown(i):
+        await bot.on_message(fixtures.message(i, f"<@!{BOT_ID}>", author))
+
+    async def equation(i):
+        eq = homework.Equation((i % 7 + 1, i % 11 - 5, i % 13 - 6))
+        eq.get_standard_form()
+        eq.get_vertex_form()
+        eq.get_zeros()
+        eq.get_vertex()
+
+    async def graph(i):
+        homework.graph((i % 7 + 1, i % 11 - 5, i % 13 - 6))
+
+    async def wolfram_local(i):
+        homework.local_answer(('what is 3^2*4?', 'solve x^2-5x+6=0')[i % 2])
+
+    async def help_index(i):
+        await meta.help.callback(meta, FakeContext(fixtures.message(i, '.help')))
+
+    async def help_command(i):
+        await meta.help.callback(meta, FakeContext(fixtures.message(i, '.help')), 'quadratics')
+
+    async def error_embed(i):
+        ctx = FakeContext(fixtures.message(i, '.quadratics 1 2'), quadratics)
+        await errors.on_command_error(ctx, commands.MissingRequiredArgument(quadratics.clean_params['c']))
+
+    async def error_cooldown(i):
+        ctx = FakeContext(fixtures.message(i, '.quadratics 1 2 3'), quadratics)
+        await errors.on_command_error(ctx, commands.CommandOnCooldown(commands.Cooldown(1, 5, commands.BucketType.user), 3.5))
+
+    return {'get_prefix': get_prefix,
+            'guild_prefix': guild_prefix,
+            'guild_prefix_db': guild_prefix_db,
+            'mention_prefix': mention_prefix,
+            'mention_cooldown': mention_cooldown,
+            'chatter': chatter,
+            'equation': equation,
+            'graph': graph,
+            'wolfram_local': wolfram_local,
+            'help_index': help_index,
+            'help_command': help_command,
+            'error_embed': error_embed,
+            'error_cooldown': error_cooldown}
+
+
+# Rendering is orders of magnitude slower than everything else
+ROUNDS = {'graph': 0.05}
+
+
+async def measure(fn, rounds):
+    """Per-call timings in microseconds after a short warm-up"""
+
+    for i in range(min(rounds, 50)):
+        await fn(i)
+
+    timings = []
+    for i in range(rounds):
+        start = perf_counter()
+        await fn(i)
+        timings.append((perf_counter() - start) * 1e6)
+
+    timings.sort()
+    return {'rounds': rounds,
+            'median_us': median(timings),
+            'p95_us': timings[int(len(timings) * 0.95)],
+            'mean_us': sum(timings) / len(timings),
+            'ops_per_s': rounds / (sum(timings) / 1e6)}
+
+
+async def reset(client):
+    """Drop replies and cooldowns left by a case so they do not leak into the next one"""
+
+    # discord.py scans every live bucket on each lookup, so thousands of authors slow the next case
+    client.cooldown._cache.clear()
+
+    workers = list(client.dispatcher.workers.values())
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    client.dispatcher = Dispatcher()
+
+
+async def run(rounds, only):
+    from harper.lib import bot
+
+    bot.setup()
+    bot.client._connection.user = FakeUser(BOT_ID, name='harper')
+    bot.client.prefilter.set_user(bot.client.user)
+    fixtures = Fixtures()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        await connect(bot, directory)
+        try:
+            for name, fn in cases(bot, fixtures).items():
+                if only and name not in only:
+                    continue
+                results[name] = await measure(fn, max(1, int(rounds * ROUNDS.get(name, 1))))
+                await reset(bot.client)
+        finally:
+            await bot.client.db.close()
+
+    return results
+
+
+def compare(results, baseline, tolerance, floor):
+    """Cases whose median regressed beyond the tolerance and by more than floor microseconds"""
+
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before and result['median_us'] > max(before['median_us'] * tolerance, before['median_us'] + floor):
+            regressions.append((name, before['median_us'], result['median_us']))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='Offline micro-benchmarks for the hot paths')
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--only', help='comma separated case names')
+    parser.add_argument('--save', action='store_true', help=f"write the results to {BASELINE}")
+    parser.add_argument('--compare', action='store_true', help='fail when a case regressed against the baseline')
+    parser.add_argument('--tolerance', type=float, default=1.3, help='allowed slowdown of the median')
+    parser.add_argument('--floor', type=float, default=5.0, help='ignore slowdowns smaller than this many µs')
+    parser.add_argument('--baseline', default=BASELINE)
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    results = asyncio.get_event_loop().run_until_complete(run(args.rounds, only))
+
+    print(f"{'case':<18}{'rounds':>8}{'median µs':>12}{'p95 µs':>12}{'ops/s':>12}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['rounds']:>8,}{r['median_us']:>12.1f}{r['p95_us']:>12.1f}{r['ops_per_s']:>12,.0f}")
+
+    if args.compare:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.tolerance, args.floor)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: median {before:.1f}µs -> {after:.1f}µs")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.2f}x of the baseline")
+
+    if args.save:
+        with open(args.baseline, 'w') as fp:
+            json.dump({'python': platform.python_version(),
+                       'discord.py': discord.__version__,
+                       'machine': platform.machine(),
+                       'rounds': args.rounds,
+                       'results': results}, fp, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
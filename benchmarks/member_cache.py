@@ -0,0 +1,115 @@
+"""Memory footprint of each member cache policy.
+
+Run from the repository root:
+
+    python -m benchmarks.member_cache [--members 50000] [--guilds 50] [--active 0.05] [--output results.json]
+
+Every policy is measured in a fresh interpreter so earlier runs cannot skew RSS.
+Payloads are parsed one guild at a time, so RSS also carries up to one guild's
+worth of allocator slack; use more guilds for tighter numbers.
+Guilds are built from synthetic GUILD_CREATE payloads through discord.py's own
+state machinery, and a share of members is replayed as message authors so the
+active and ttl policies have something to hold.
+"""
+
+# 3rd party modules
+import discord
+from discord.state import ConnectionState
+from psutil import Process
+
+# Builtin modules
+import gc
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+
+# Local modules
+from harper.lib.utils.members import MemberCache, POLICIES
+
+MiB = 1024**2
+
+
+def member_data(user_id):
+    return {'user': {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0001', 'avatar': None},
+            'roles': [],
+            'joined_at': '2021-01-01T00:00:00+00:00',
+            'deaf': False,
+            'mute': False}
+
+
+def guild_data(guild_id, first_user, members):
+    return {'id': str(guild_id),
+            'name': f"guild{guild_id}",
+            'member_count': members,
+            'members': [member_data(first_user + i) for i in range(members)],
+            'roles': [],
+            'channels': [],
+            'emojis': []}
+
+
+def measure(policy, members, guilds, active):
+    """RSS growth from caching members under one policy, in this process"""
+
+    intents = discord.Intents.default()
+    intents.members = True
+    cache = MemberCache(policy, maxsize=max(1, int(members * active)))
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, syncer=None, http=None, loop=None,
+                            intents=intents, member_cache_flags=cache.flags(intents))
+
+    per_guild = members // guilds
+
+    gc.collect()
+    before = Process().memory_info().rss
+
+    built = []
+    for g in range(guilds):
+        # One payload alive at a time, the way the gateway delivers them
+        payload = guild_data(g + 1, g * per_guild + 1, per_guild)
+        guild = discord.Guild(data=payload, state=state)
+        for mdata in payload['members'][:int(per_guild * active)]:
+            cache.seen(discord.Member(data=mdata, guild=guild, state=state))
+        built.append(guild)
+        del payload
+
+    gc.collect()
+    after = Process().memory_info().rss
+
+    return {'policy': policy,
+            'members': per_guild * guilds,
+            'cached': sum(len(guild.members) for guild in built),
+            'rss_bytes': after - before,
+            'rss_mib_per_10k': (after - before) / MiB / (per_guild * guilds) * 10000}
+
+
+def main():
+    parser = ArgumentParser(description='Member cache RSS per 10k members for each policy')
+    parser.add_argument('--members', type=int, default=50000)
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--active', type=float, default=0.05, help='share of members that send messages')
+    parser.add_argument('--policy', choices=POLICIES, help='measure one policy in this process and print JSON')
+    parser.add_argument('--output', help='write all results to this JSON file')
+    args = parser.parse_args()
+
+    if args.policy:
+        print(json.dumps(measure(args.policy, args.members, args.guilds, args.active)))
+        return
+
+    results = []
+    for policy in POLICIES:
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.member_cache', '--policy', policy,
+                              '--members', str(args.members), '--guilds', str(args.guilds), '--active', str(args.active)],
+                             check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.splitlines()[-1]))
+
+    print(f"{'policy':<8}{'members':>10}{'cached':>10}{'RSS MiB':>10}{'MiB/10k':>10}")
+    for r in results:
+        print(f"{r['policy']:<8}{r['members']:>10,}{r['cached']:>10,}{r['rss_bytes'] / MiB:>10.1f}{r['rss_mib_per_10k']:>10.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
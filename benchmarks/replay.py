@@ -0,0 +1,539 @@
+"""Replay message traffic through the real bot against a local fake Discord.
+
+Run from the repository root:
+
+    python -m benchmarks.replay [--rates 50,100,200,400] [--duration 20] [--guilds 50] [--channels 20]
+                                [--mix prefix=1,quadratics=1,wolfram=1,chatter=4] [--replay messages.jsonl]
+                                [--wolfram-delay 0.2] [--output results.json]
+
+This process serves a stand-in gateway (websocket) and REST API on localhost and
+starts the bot from harper.lib.bot in a child process with discord.Route.BASE and
+the Wolfram|Alpha URL pointed at it, a temporary database and no token. Once the
+bot is ready and a --warmup step has run, MESSAGE_CREATE events are sent at each
+offered rate for --duration seconds.
+
+Each channel carries at most one command waiting for a reply, so the next reply
+posted to that channel belongs to it. A command for a guild with no free channel
+is counted as backlogged instead of sent. Latency runs from the MESSAGE_CREATE frame
+to the reply's REST request. Chatter is ordinary conversation that only goes
+through prefix resolution and is never answered. The child samples its own
+event-loop lag every 50 ms and writes it to a file read after each step.
+
+A recorded stream is a JSON lines file with one message per line:
+{"t": seconds from start, "content": "...", "guild": index, "kind": "prefix"}
+where kind is prefix, quadratics, wolfram or chatter. --rates then scales its
+original pace, 1 being real time.
+
+The saturation point is the first offered rate where replies fall below 90%
+of what was offered or the p95 latency exceeds --slo seconds.
+"""
+
+# 3rd party modules
+import discord
+from aiohttp import web, WSMsgType
+
+# Builtin modules
+import sys
+import json
+import random
+import asyncio
+import tempfile
+import subprocess
+from os import path, environ
+from itertools import count
+from time import perf_counter, time
+from collections import deque, Counter, defaultdict
+from argparse import ArgumentParser, SUPPRESS
+
+HOST = '127.0.0.1'
+BOT_ID = 1000
+GUILD_BASE = 10**17
+CHANNEL_BASE = 2 * 10**17
+AUTHOR_BASE = 3 * 10**17
+TIMEOUT = 30.0
+LAG_INTERVAL = 0.05
+
+KINDS = ('prefix', 'quadratics', 'wolfram', 'chatter')
+
+
+def user_data(user_id, bot=False):
+    return {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0001', 'avatar': None, 'bot': bot}
+
+
+def member_data(user_id, bot=False):
+    return {'user': user_data(user_id, bot), 'roles': [], 'joined_at': '2021-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False}
+
+
+def guild_data(guild, channels):
+    guild_id = GUILD_BASE + guild
+    return {'id': str(guild_id),
+            'name': f"guild{guild}",
+            'unavailable': False,
+            'member_count': 1,
+            'members': [member_data(BOT_ID, bot=True)],
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': str(discord.Permissions.text().value),
+                       'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': str(channel_id(guild, c, channels)), 'type': 0, 'name': f"channel{c}",
+                          'position': c, 'permission_overwrites': []} for c in range(channels)],
+            'emojis': []}
+
+
+def channel_id(guild, channel, channels):
+    return CHANNEL_BASE + guild * channels + channel
+
+
+def message_data(message_id, channel, guild, author, content):
+    return {'id': str(message_id),
+            'channel_id': str(channel),
+            'guild_id': str(guild) if guild else None,
+            'author': user_data(author, bot=author == BOT_ID),
+            'member': {'roles': [], 'joined_at': '2021-01-01T00:00:00+00:00', 'deaf': False, 'mute': False},
+            'content': content,
+            'timestamp': '2021-01-01T00:00:00+00:00',
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+            'flags': 0}
+
+
+def json_response(data):
+    # discord.py only parses bodies whose content type is exactly application/json, without a charset
+    return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+
+class Workload(object):
+    """Synthetic messages following the kind mix, or a recorded stream"""
+
+    def __init__(self, guilds, prefixed, mix, recorded=None):
+        self.guilds = guilds
+        self.prefixed = prefixed
+        self.kinds, self.weights = zip(*mix.items())
+        self.recorded = recorded
+        self.random = random.Random(0)
+
+    def prefix(self, guild):
+        return f"p{guild}!" if guild < self.prefixed else '.'
+
+    def content(self, kind, guild):
+        prefix = self.prefix(guild)
+        if kind == 'prefix':
+            return f"<@!{BOT_ID}>"
+        if kind == 'quadratics':
+            # A small coefficient space, so the graph cache sees realistic repeats
+            r = self.random
+            return f"{prefix}quadratics {r.randint(1, 5)} {r.randint(-9, 9)} {r.randint(-9, 9)}"
+        if kind == 'wolfram':
+            return f"{prefix}wolfram integrate x^{self.random.randint(1, 50)}"
+        return 'just chatting about homework'
+
+    def synthetic(self, rate, duration):
+        """(offset, kind, guild, content) at an even pace"""
+
+        for i in range(int(rate * duration)):
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            guild = self.random.randrange(self.guilds)
+            yield i / rate, kind, guild, self.content(kind, guild)
+
+    def replay(self, speed, duration):
+        """(offset, kind, guild, content) from the recording, scaled by speed"""
+
+        for entry in self.recorded:
+            offset = entry['t'] / speed
+            if offset > duration:
+                break
+            guild = entry.get('guild', 0) % self.guilds
+            kind = entry.get('kind', 'chatter')
+            yield offset, kind, guild, entry.get('content') or self.content(kind, guild)
+
+    def messages(self, rate, duration):
+        if self.recorded is not None:
+            return self.replay(rate, duration)
+        return self.synthetic(rate, duration)
+
+
+class FakeDiscord(object):
+    """Gateway and REST stand-in holding the state needed to match replies to commands"""
+
+    def __init__(self, guilds, channels, wolfram_delay):
+        self.guilds = guilds
+        self.channels = channels
+        self.wolfram_delay = wolfram_delay
+        self.ids = count(4 * 10**17)
+        self.authors = count(AUTHOR_BASE)
+        self.ws = None
+        self.seq = 0
+        self.ready = asyncio.Event()
+        self.free = {g: deque(channel_id(g, c, channels) for c in range(channels)) for g in range(guilds)}
+        # channel id -> (kind, sent at)
+        self.waiting = {}
+        self.latency = defaultdict(list)
+        self.replies = 0
+        self.unexpected = 0
+        self.timed_out = Counter()
+        self.app = web.Application(client_max_size=64 * 1024**2)
+        self.app.add_routes([web.get('/gateway', self.gateway),
+                             web.get('/wolfram', self.wolfram),
+                             web.get('/api/{version}/gateway', self.gateway_url),
+                             web.get('/api/{version}/gateway/bot', self.gateway_url),
+                             web.get('/api/{version}/users/@me', self.me),
+                             web.get('/api/{version}/oauth2/applications/@me', self.application),
+                             web.post('/api/{version}/channels/{channel}/messages', self.create_message),
+                             web.post('/api/{version}/channels/{channel}/typing', self.no_content),
+                             web.route('*', '/api/{version}/{tail:.*}', self.no_content)])
+
+    @property
+    def url(self):
+        return f"http://{HOST}:{self.port}"
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, HOST, 0, shutdown_timeout=1.0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    # REST
+
+    async def gateway_url(self, request):
+        return json_response({'url': f"ws://{HOST}:{self.port}/gateway", 'shards': 1,
+                                  'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0,
+                                                          'max_concurrency': 1}})
+
+    async def me(self, request):
+        return json_response(user_data(BOT_ID, bot=True))
+
+    async def application(self, request):
+        return json_response({'id': str(BOT_ID), 'name': 'harper', 'icon': None, 'description': '',
+                                  'rpc_origins': None, 'bot_public': True, 'bot_require_code_grant': False,
+                                  'owner': user_data(1)})
+
+    async def no_content(self, request):
+        return web.Response(status=204)
+
+    async def create_message(self, request):
+        now = perf_counter()
+        channel = int(request.match_info['channel'])
+        await request.read()
+
+        waiting = self.waiting.pop(channel, None)
+        if waiting is None:
+            self.unexpected += 1
+        else:
+            kind, sent = waiting
+            self.latency[kind].append(now - sent)
+            self.replies += 1
+            self.release(channel)
+
+        guild = (channel - CHANNEL_BASE) // self.channels
+        return json_response(message_data(next(self.ids), channel, GUILD_BASE + guild, BOT_ID, ''))
+
+    async def wolfram(self, request):
+        await asyncio.sleep(self.wolfram_delay)
+        question = request.query.get('input', '')
+        return json_response({'queryresult': {'success': True, 'pods': [
+            {'title': 'Result', 'primary': True, 'subpods': [{'plaintext': f"answer to {question}"}]}]}})
+
+    # Gateway
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.ws = ws
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': 41250}})
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            if data['op'] == 1:
+                await ws.send_json({'op': 11})
+            elif data['op'] == 2:
+                await self.identify()
+            elif data['op'] == 3:
+                # The bot sets its presence once it is ready
+                self.ready.set()
+
+        return ws
+
+    async def dispatch(self, event, data):
+        self.seq += 1
+        await self.ws.send_str(json.dumps({'op': 0, 't': event, 's': self.seq, 'd': data}))
+
+    async def identify(self):
+        await self.dispatch('READY', {'v': 6, 'user': user_data(BOT_ID, bot=True), 'session_id': 'replay',
+                                      'guilds': [{'id': str(GUILD_BASE + g), 'unavailable': True} for g in range(self.guilds)],
+                                      'private_channels': [], 'relationships': [],
+                                      'application': {'id': str(BOT_ID), 'flags': 0}})
+        for g in range(self.guilds):
+            await self.dispatch('GUILD_CREATE', guild_data(g, self.channels))
+
+    async def message(self, kind, guild, content):
+        """Send one MESSAGE_CREATE, False when no channel is free to carry a command"""
+
+        if kind == 'chatter':
+            channel = channel_id(guild, 0, self.channels)
+        elif self.free[guild]:
+            channel = self.free[guild].popleft()
+            self.waiting[channel] = (kind, perf_counter())
+        else:
+            return False
+
+        await self.dispatch('MESSAGE_CREATE', message_data(next(self.ids), channel, GUILD_BASE + guild,
+                                                           next(self.authors), content))
+        return True
+
+    def expire(self):
+        """Free channels whose reply never came"""
+
+        now = perf_counter()
+        expired = [channel for channel, (kind, sent) in self.waiting.items() if now - sent > TIMEOUT]
+        for channel in expired:
+            kind, sent = self.waiting.pop(channel)
+            self.timed_out[kind] += 1
+            self.release(channel)
+        return len(expired)
+
+    def release(self, channel):
+        self.free[(channel - CHANNEL_BASE) // self.channels].append(channel)
+
+    def reset(self):
+        self.latency = defaultdict(list)
+        self.replies = 0
+        self.unexpected = 0
+        self.timed_out = Counter()
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def read_lag(lag_file, start, stop):
+    """Child event-loop lag samples taken between two wall clock times"""
+
+    lags = []
+    with open(lag_file) as fp:
+        for line in fp:
+            at, lag = map(float, line.split())
+            if start <= at <= stop:
+                lags.append(lag)
+    return lags
+
+
+async def step(fake, workload, rate, duration, lag_file):
+    """Offer one rate for the duration and collect what came back"""
+
+    fake.reset()
+    offered = Counter()
+    backlogged = 0
+    expired = 0
+    started_at = time()
+    started = perf_counter()
+
+    for offset, kind, guild, content in workload.messages(rate, duration):
+        delay = started + offset - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if await fake.message(kind, guild, content):
+            offered[kind] += 1
+        else:
+            backlogged += 1
+        expired += fake.expire()
+
+    # Let replies to the last commands arrive
+    drain = perf_counter()
+    while fake.waiting and perf_counter() - drain < TIMEOUT:
+        await asyncio.sleep(0.05)
+    expired += fake.expire()
+    elapsed = perf_counter() - started
+    lags = read_lag(lag_file, started_at, time())
+
+    commands = sum(n for kind, n in offered.items() if kind != 'chatter')
+    latencies = [l for values in fake.latency.values() for l in values]
+    return {'rate': rate,
+            'offered': sum(offered.values()),
+            'commands': commands,
+            'replies': fake.replies,
+            'unexpected_replies': fake.unexpected,
+            'backlogged': backlogged,
+            'timed_out': expired,
+            'throughput': fake.replies / elapsed,
+            'completion': fake.replies / commands if commands else 1.0,
+            'p50': quantile(latencies, 0.5),
+            'p95': quantile(latencies, 0.95),
+            'p99': quantile(latencies, 0.99),
+            'by_kind': {kind: {'n': len(fake.latency[kind]), 'timed_out': fake.timed_out[kind],
+                               'p50': quantile(fake.latency[kind], 0.5), 'p95': quantile(fake.latency[kind], 0.95)}
+                        for kind in set(fake.latency) | set(fake.timed_out)},
+            'loop_lag_p50': quantile(lags, 0.5),
+            'loop_lag_p99': quantile(lags, 0.99),
+            'loop_lag_max': max(lags) if lags else None}
+
+
+async def harness(args, workload):
+    fake = FakeDiscord(args.guilds, args.channels, args.wolfram_delay)
+    await fake.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        lag_file = path.join(directory, 'lag.txt')
+        open(lag_file, 'w').close()
+        child = subprocess.Popen([sys.executable, '-m', 'benchmarks.replay', '--bot', '--server', fake.url,
+                                  '--lag-file', lag_file, '--directory', directory,
+                                  '--prefixed', str(args.prefixed)],
+                                 stdout=None if args.verbose else subprocess.DEVNULL,
+                                 stderr=None if args.verbose else subprocess.DEVNULL)
+        results = []
+        try:
+            await asyncio.wait_for(fake.ready.wait(), timeout=120)
+            print(f"Bot ready with {args.guilds} guilds and {args.guilds * args.channels:,} channels")
+
+            if args.warmup:
+                # Fill caches and start the render workers before anything is measured
+                await step(fake, workload, args.rates[0], args.warmup, lag_file)
+
+            for rate in args.rates:
+                result = await step(fake, workload, rate, args.duration, lag_file)
+                results.append(result)
+                print(f"{rate:>8g}{result['offered']:>9,}{result['throughput']:>12,.1f}{result['completion']:>8.1%}"
+                      f"{ms(result['p50'])}{ms(result['p95'])}{ms(result['p99'])}{ms(result['loop_lag_p99'])}"
+                      f"{result['backlogged']:>9,}{result['timed_out']:>7,}")
+        finally:
+            child.terminate()
+            try:
+                child.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+            await fake.stop()
+
+    return results
+
+
+def ms(seconds):
+    return f"{'-':>9}" if seconds is None else f"{seconds * 1000:>9.1f}"
+
+
+def saturation(results, slo):
+    """First offered rate the bot could not keep up with"""
+
+    for result in results:
+        if result['completion'] < 0.9 or (result['p95'] or 0) > slo:
+            return result['rate']
+    return None
+
+
+async def sample_lag(lag_file):
+    """Append (wall time, lag) every LAG_INTERVAL, flushed about once a second"""
+
+    loop = asyncio.get_event_loop()
+    with open(lag_file, 'a') as fp:
+        while True:
+            for _ in range(int(1 / LAG_INTERVAL)):
+                start = loop.time()
+                await asyncio.sleep(LAG_INTERVAL)
+                fp.write(f"{time()} {loop.time() - start - LAG_INTERVAL}\n")
+            fp.flush()
+
+
+def run_bot(args):
+    """Child process: the real bot, pointed at the fake server"""
+
+    # Synthetic quadratics must not load from or save into the real cache file
+    environ['HARPER_PERSIST_CACHE'] = '0'
+
+    from harper.lib import bot
+    from harper.lib.utils.log import setup_logging
+    from harper.lib.utils.wolfram import WolframClient
+
+    setup_logging(filename=None)
+
+    discord.http.Route.BASE = f"{args.server}/api/v7"
+    bot.DB_PATH = path.join(args.directory, 'database.db')
+
+    client = bot.client
+    client.started = perf_counter()
+    client.version = 'replay'
+    bot.setup()
+    client.wolfram = WolframClient('replay', url=f"{args.server}/wolfram")
+    # Any free port, so a bot already running on this host does not stop the harness
+    client.metrics.port = 0
+
+    async def prepare():
+        await bot.connect_db()
+        for guild in range(args.prefixed):
+            await client.db.execute('INSERT INTO prefixes (id, prefix) VALUES (?, ?)', (GUILD_BASE + guild, f"p{guild}!"))
+        await client.prefixes.load(client.db)
+
+    client.loop.run_until_complete(prepare())
+    client.loop.create_task(sample_lag(args.lag_file))
+    client.run('replay', reconnect=False)
+
+
+def main():
+    parser = ArgumentParser(description='Replay message traffic through the bot against a local fake Discord')
+    parser.add_argument('--rates', default='50,100,200,400', help='messages per second, or speed-ups of a recording')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per rate')
+    parser.add_argument('--warmup', type=float, default=5.0, help='unmeasured seconds at the first rate')
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--channels', type=int, default=20, help='text channels per guild')
+    parser.add_argument('--prefixed', type=int, default=10, help='guilds with a custom prefix')
+    parser.add_argument('--mix', default='prefix=1,quadratics=1,wolfram=1,chatter=4')
+    parser.add_argument('--replay', help='JSON lines file of recorded messages')
+    parser.add_argument('--wolfram-delay', type=float, default=0.2, help='seconds the fake Wolfram|Alpha takes')
+    parser.add_argument('--slo', type=float, default=1.0, help='p95 latency in seconds that counts as saturated')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help="show the bot's output")
+    # Used by the harness to start the bot
+    parser.add_argument('--bot', action='store_true', help=SUPPRESS)
+    parser.add_argument('--server', help=SUPPRESS)
+    parser.add_argument('--lag-file', help=SUPPRESS)
+    parser.add_argument('--directory', help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bot:
+        run_bot(args)
+        return
+
+    args.rates = [float(rate) for rate in args.rates.split(',')]
+    mix = {kind: float(weight) for kind, weight in (part.split('=') for part in args.mix.split(','))}
+    unknown = set(mix) - set(KINDS)
+    if unknown:
+        parser.error(f"unknown message kinds {', '.join(sorted(unknown))}, use {', '.join(KINDS)}")
+
+    recorded = None
+    if args.replay:
+        with open(args.replay) as fp:
+            recorded = [json.loads(line) for line in fp if line.strip()]
+
+    workload = Workload(args.guilds, args.prefixed, mix, recorded)
+
+    print(f"{'rate':>8}{'offered':>9}{'replies/s':>12}{'done':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'lag p99':>9}{'backlog':>9}{'t/o':>7}")
+    results = asyncio.get_event_loop().run_until_complete(harness(args, workload))
+
+    point = saturation(results, args.slo)
+    if point is None:
+        print('Did not saturate, try higher rates')
+    else:
+        print(f"Saturated at {point:g} messages per second")
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'args': {k: v for k, v in vars(args).items() if k not in ('bot', 'server', 'lag_file', 'directory')},
+                       'saturation': point,
+                       'results': results}, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
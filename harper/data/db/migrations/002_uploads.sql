@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS uploads (
+  sha256 text PRIMARY KEY,
+  path text,
+  size integer
+)
@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS catalog (
+  id integer PRIMARY KEY,
+  user integer NOT NULL,
+  day text NOT NULL,
+  topic text NOT NULL DEFAULT '',
+  page integer NOT NULL,
+  path text NOT NULL,
+  size integer,
+  saved_at integer NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS catalog_user_day_topic_page ON catalog (user, day, topic, page);
+CREATE INDEX IF NOT EXISTS catalog_user_topic ON catalog (user, topic, day, page)
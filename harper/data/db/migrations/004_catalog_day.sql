@@ -0,0 +1,25 @@
+-- Integer affinity stores numeric days as integers, so Day 2 sorts before Day 10,
+-- while days that are not numbers stay text and sort after them
+DROP INDEX catalog_user_day_topic_page;
+DROP INDEX catalog_user_topic;
+
+CREATE TABLE catalog_new (
+  id integer PRIMARY KEY,
+  user integer NOT NULL,
+  day integer NOT NULL,
+  topic text NOT NULL DEFAULT '',
+  page integer NOT NULL,
+  path text NOT NULL,
+  size integer,
+  saved_at integer NOT NULL
+);
+
+CREATE UNIQUE INDEX catalog_user_day_topic_page ON catalog_new (user, day, topic, page);
+CREATE INDEX catalog_user_topic ON catalog_new (user, topic, day, page);
+
+-- Days such as 2 and 02 become the same day, the most recently saved page wins like it does in download
+INSERT OR REPLACE INTO catalog_new (id, user, day, topic, page, path, size, saved_at)
+SELECT id, user, day, topic, page, path, size, saved_at FROM catalog ORDER BY saved_at, id;
+
+DROP TABLE catalog;
+ALTER TABLE catalog_new RENAME TO catalog
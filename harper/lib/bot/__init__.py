@@ -1,84 +1,133 @@
 from discord import Intents, DMChannel
 from discord.ext.commands import Bot 
-from aiosqlite import connect
-from discord.ext.commands import Bot
-from asyncio import sleep, get_event_loop
+from discord.ext.commands import Bot, AutoShardedBot
+from asyncio import Event, gather
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
 from discord.ext.commands import when_mentioned_or, CooldownMapping, BucketType
 
 # Builtin modules
 from glob import glob
 from pathlib import Path
-from os import getcwd, sep
+from os import getcwd, sep, environ
 from json import load
-from logging import basicConfig, INFO
+from time import perf_counter
+from datetime import datetime
+from logging import getLogger
+
+# Local modules
+from harper.lib.bot.cluster import report
+from harper.lib.utils import lazy
+from harper.lib.utils.counters import MemberCounter
+from harper.lib.utils.database import Database
+from harper.lib.utils.dispatch import Dispatcher
+from harper.lib.utils.help import HelpIndex
+from harper.lib.utils.log import setup_logging
+from harper.lib.utils.members import MemberCache
+from harper.lib.utils.metrics import Sampler, MetricsServer, Telemetry, PORT
+from harper.lib.utils.prefilter import PrefixFilter
+from harper.lib.utils.prefixes import PrefixCache
+from harper.lib.utils.presence import Presence
+from harper.lib.utils.watchdog import Watchdog
+from harper.lib.utils.migrations import migrate
+from harper.lib.utils.wolfram import WolframClient
 
 # Logging
+log = getLogger(__name__)
 cwd = Path(__file__).parents[0]
 cwd = str(cwd)
-print(f"{cwd}\n-----")
-basicConfig(level=INFO)
 
 # Locate all Cogs
 COGS = [path.split(sep)[-1][:-3] for path in glob('harper/lib/cogs/*.py')]
 
+# Sharding, set per process by the cluster launcher or HARPER_SHARDED=1 for one sharded process
+CLUSTER_ID = int(environ.get('HARPER_CLUSTER', 0))
+SHARD_COUNT = int(environ['HARPER_SHARD_COUNT']) if 'HARPER_SHARD_COUNT' in environ else None
+SHARD_IDS = [int(i) for i in environ['HARPER_SHARD_IDS'].split(',')] if 'HARPER_SHARD_IDS' in environ else None
+SHARDED = environ.get('HARPER_SHARDED') == '1' or SHARD_COUNT is not None
+
+# Member cache policy: full, none, active or ttl
+MEMBER_CACHE = environ.get('HARPER_MEMBER_CACHE', 'full')
+
+# One log file per cluster, they rotate independently
+LOG_PATH = f"harper/data/logs/cluster-{CLUSTER_ID}.log" if 'HARPER_CLUSTER' in environ else 'harper/data/logs/harper.log'
+
+# Import heavy dependencies in the background after on_ready
+PREWARM = True
+
 # DB files
 DB_PATH = "harper/data/db/database.db"
-BUILD_PATH = "harper/data/db/build.sql"
+MIGRATIONS_PATH = "harper/data/db/migrations"
 
 async def get_prefix(client, message):
     if isinstance(message.channel, DMChannel):
         return when_mentioned_or('.')(client, message)
     else:
-        cur = await client.db.cursor()
-        await cur.execute('SELECT prefix FROM prefixes WHERE id = ?', (message.guild.id,))
-        prefix = await cur.fetchone()
-        await cur.close()
-        if not prefix: 
-            return when_mentioned_or('.')(client, message)
-        else:
-            return when_mentioned_or(prefix[0])(client, message)
+        prefix = await client.prefixes.fetch(client.db, message.guild.id)
+        return when_mentioned_or(prefix)(client, message)
 
 async def guild_prefix(message):
     if isinstance(message.channel, DMChannel):
         return '.'
-    else:    
-        cur = await client.db.cursor()
-        await cur.execute('SELECT prefix FROM prefixes WHERE id = ?', (message.guild.id,))
-        prefix = await cur.fetchone()
-        await cur.close()
-        if not prefix:
-            return '.'
-        else:
-            return prefix[0]
+    else:
+        return await client.prefixes.fetch(client.db, message.guild.id)
+
+async def expire_members():
+    """Drop cached authors past the ttl, on the event loop rather than a scheduler thread"""
+
+    client.member_cache.expire()
 
 class Ready(object):
-    """Cog console logging on startup"""
+    """Cog readiness, signalled with one event per cog"""
 
     def __init__(self):
-        print(COGS)
-        for cog in COGS:
-            # commands.cog = False, fun.cog = False
-            setattr(self, cog, False)
+        log.debug('Cogs found: %s', ', '.join(COGS))
+        self.events = {cog: Event() for cog in COGS}
 
     def ready_up(self, cog):
         """Singular Cog ready"""
 
-        setattr(self, cog, True)
-        print(f"{cog} cog ready")
+        self.events.setdefault(cog.lower(), Event()).set()
+        log.info('%s cog ready', cog)
 
     def all_ready(self):
         """All Cogs ready"""
 
-        return all([getattr(self, cog) for cog in COGS])
+        return all(event.is_set() for event in self.events.values())
+
+    async def wait(self):
+        """Wait until every Cog is ready"""
+
+        await gather(*(event.wait() for event in self.events.values()))
 
 intents = Intents.default()
-client = Bot(command_prefix=get_prefix, intents=intents, case_insensitive=True, help_command=None)
+member_cache = MemberCache(MEMBER_CACHE)
+if SHARDED:
+    client = AutoShardedBot(command_prefix=get_prefix, intents=intents, case_insensitive=True, help_command=None,
+                            shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **member_cache.options(intents))
+else:
+    client = Bot(command_prefix=get_prefix, intents=intents, case_insensitive=True, help_command=None,
+                 **member_cache.options(intents))
 
 client.prefix = guild_prefix
+client.prefixes = PrefixCache(default='.')
+client.prefilter = PrefixFilter(client.prefixes)
+client.member_cache = member_cache
+client.counter = MemberCounter(exact=member_cache.exact)
+client.sampler = Sampler(client)
+# One metrics port per cluster so clusters on the same host do not collide
+client.metrics = MetricsServer(client.sampler, port=PORT + CLUSTER_ID)
+client.telemetry = Telemetry()
+client.watchdog = Watchdog(client.telemetry)
+client.help_index = HelpIndex()
+client.dispatcher = Dispatcher()
+client.presence = Presence(client, 'playing a game | {guilds:,} servers & {users:,} users | version {version:s}')
+client.cluster_id = CLUSTER_ID
+client.cluster_stats = None
 client.ready = False
 client.cogs_ready = Ready()
 client.scheduler = AsyncIOScheduler()
+client.scheduler.add_job(expire_members, IntervalTrigger(minutes=1), id='expire_members')
 client.cooldown = CooldownMapping.from_cooldown(1, 5, BucketType.user)
 client.colours = {'WHITE': 0xFFFFFF,
                 'AQUA': 0x1ABC9C,
@@ -106,61 +155,109 @@ def setup():
     """Initial Cog loader"""
 
     for cog in COGS:
+        start = perf_counter()
         client.load_extension(f"harper.lib.cogs.{cog}")
-        print(f"Initial setup for {cog}.py")
+        lazy.record(f"harper.lib.cogs.{cog}", perf_counter() - start)
+        log.info('Initial setup for %s.py', cog)
+
+    client.help_index.build(client)
+    log.info('Cog setup complete')
+    log.info('Import times\n%s', lazy.report())
+
+async def prewarm():
+    """Import lazily loaded dependencies in the background once the bot is ready"""
 
-    print('Cog setup complete')
+    await client.loop.run_in_executor(None, lazy.prewarm)
+    log.info('Import times after pre-warming\n%s', lazy.report())
+
+    # Graphs render in their own processes, which import numpy and matplotlib for themselves
+    homework = client.get_cog('Homework')
+    if homework is not None:
+        await homework.renderer.warm()
+        log.info('Render workers started')
 
 def launch(version):
     """Run the bot using the API token"""
 
+    client.started = perf_counter()
     client.version = version
-    print('Running setup...')
+    setup_logging(filename=LOG_PATH)
+    log.info('Running setup...')
     setup()
     with open('harper/lib/bot/secrets.json', 'r') as tf:
         data = load(tf)
         client.TOKEN = data['bot_token']
         client.wolfram_id = data['wolfram_id']
+        client.wolfram = WolframClient(client.wolfram_id)
+
+    client.loop.run_until_complete(connect_db())
 
-    print(f"Running your bot on version {client.version}...")
+    log.info('Running your bot on version %s...', client.version)
 
     client.run(client.TOKEN, reconnect=True)
 
 async def connect_db():
+    """Open the database and bring its schema up to date"""
 
-    client.db = await connect(DB_PATH)
+    client.db = Database(DB_PATH)
+    await client.db.connect()
 
-get_event_loop().run_until_complete(connect_db())
+    for migration in await migrate(client.db.writer, MIGRATIONS_PATH):
+        log.info('Applied migration %s', migration)
+    await client.prefixes.load(client.db)
 
 @client.event
 async def on_ready():
 
-    cur = await client.db.cursor()
-    with open(BUILD_PATH, 'r', encoding='utf-8') as script:
-	    await cur.executescript(script.read())
+    # Reconnects fire on_ready again, everything below only needs to happen once
+    if client.ready or client.scheduler.running:
+        return
 
+    if client.cluster_stats is not None:
+        client.scheduler.add_job(report, IntervalTrigger(seconds=15), args=(client,),
+                                 id='cluster_report', replace_existing=True, next_run_time=datetime.now())
+    client.prefilter.set_user(client.user)
+    client.watchdog.start(client.loop)
     client.scheduler.start()
+    await client.metrics.start()
 
-    while not client.cogs_ready.all_ready():
-        await sleep(0.5)
-    print(f"Your bot is online and ready to go!")
+    await client.cogs_ready.wait()
+    log.info('Your bot is online and ready to go! (%.2fs to ready)', perf_counter() - client.started)
     client.ready = True
 
     meta = client.get_cog('Meta')
     await meta.set()
 
+    if PREWARM:
+        client.loop.create_task(prewarm())
+
+@client.before_invoke
+async def before_invoke(ctx):
+    client.telemetry.before_invoke(ctx)
+
+@client.after_invoke
+async def after_invoke(ctx):
+    client.telemetry.after_invoke(ctx)
+
 @client.event
 async def on_message(message):
 
-    if message.content.startswith(f"<@!{client.user.id}>") and \
-        len(message.content) == len(f"<@!{client.user.id}>"
-    ):
+    client.member_cache.seen(message.author)
+
+    # Ordinary chat never reaches get_prefix or the database
+    if not client.prefilter.check(message):
+        return
+
+    if client.prefilter.is_mention(message.content):
 
         bucket = client.cooldown.get_bucket(message)
         retry_after = bucket.update_rate_limit()
         if retry_after:
-            await message.channel.send(f"Slow Down {message.author.mention}! Please wait {round(retry_after, 3)} seconds.")
+            client.dispatcher.send(message.channel, f"Slow Down {message.author.mention}! Please wait {round(retry_after, 3)} seconds.",
+                                   key=('cooldown', message.author.id), max_age=retry_after)
         else:
-            await message.channel.send(f"Hey {message.author.mention}! My prefix here is `{await client.prefix(message)}`\nDo `{await client.prefix(message)}help` to get started.", delete_after=10)
+            prefix = await client.prefix(message)
+            client.dispatcher.send(message.channel, f"Hey {message.author.mention}! My prefix here is `{prefix}`\nDo `{prefix}help` to get started.",
+                                   key=('prefix', message.author.id), delete_after=10)
 
     await client.process_commands(message)
\ No newline at end of file
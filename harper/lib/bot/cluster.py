@@ -0,0 +1,161 @@
+# 3rd party modules
+from aiosqlite import connect
+
+# Builtin modules
+import asyncio
+from os import environ
+from time import time, sleep
+from logging import getLogger
+from multiprocessing import get_context
+
+# Local modules
+from harper.lib.utils.log import setup_logging
+from harper.lib.utils.migrations import migrate
+
+log = getLogger(__name__)
+
+# Seconds to wait before restarting a crashed cluster, doubled per consecutive crash
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+# A cluster that stays up this long is considered healthy again
+STABLE_AFTER = 600
+
+
+def shard_ranges(shard_count, clusters):
+    """Split shard ids into contiguous, near-equal ranges, one per cluster"""
+
+    size, extra = divmod(shard_count, clusters)
+    ranges, start = [], 0
+    for cluster in range(clusters):
+        end = start + size + (1 if cluster < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def run_cluster(version, stats):
+    """Worker process entry point, the shard environment is already set"""
+
+    from harper.lib.bot import client, launch
+
+    client.cluster_stats = stats
+    launch(version)
+
+
+async def report(client):
+    """Publish this cluster's per-shard latency and guild counts for the supervisor"""
+
+    shards = {shard_id: {'latency': latency, 'guilds': 0} for shard_id, latency in client.latencies}
+    for guild in client.guilds:
+        if guild.shard_id in shards:
+            shards[guild.shard_id]['guilds'] += 1
+
+    client.cluster_stats[client.cluster_id] = {'shards': shards,
+                                               'guilds': client.counter.guilds,
+                                               'users': client.counter.users,
+                                               'updated': time()}
+
+
+class Supervisor(object):
+    """Runs one AutoShardedBot per cluster process and restarts clusters that crash"""
+
+    def __init__(self, version, clusters, shard_count):
+        if shard_count < clusters:
+            raise ValueError(f"{clusters} clusters need at least as many shards, got {shard_count}")
+
+        self.version = version
+        self.shard_count = shard_count
+        self.ranges = shard_ranges(shard_count, clusters)
+        self.context = get_context('spawn')
+        self.manager = self.context.Manager()
+        self.stats = self.manager.dict()
+        self.processes = {}
+        self.started = {}
+        self.crashes = {}
+        self.restart_at = {}
+
+    def start(self, cluster):
+        shard_ids = self.ranges[cluster]
+
+        # Spawned processes inherit the environment as it is at start()
+        environ.update(HARPER_CLUSTER=str(cluster),
+                       HARPER_SHARD_COUNT=str(self.shard_count),
+                       HARPER_SHARD_IDS=','.join(map(str, shard_ids)))
+        process = self.context.Process(target=run_cluster, args=(self.version, self.stats),
+                                       name=f"harper-cluster-{cluster}")
+        process.start()
+
+        self.processes[cluster] = process
+        self.started[cluster] = time()
+        log.info('Started cluster %d (shards %d-%d of %d) as pid %d', cluster, shard_ids[0], shard_ids[-1], self.shard_count, process.pid)
+
+    def migrate(self):
+        """Bring the schema up to date once, so clusters starting together never race to migrate"""
+
+        from harper.lib.bot import DB_PATH, MIGRATIONS_PATH
+
+        async def run():
+            async with connect(DB_PATH) as db:
+                for migration in await migrate(db, MIGRATIONS_PATH):
+                    log.info('Applied migration %s', migration)
+
+        asyncio.run(run())
+
+    def check(self):
+        """Restart crashed clusters, returning how many are still running or restarting"""
+
+        running = 0
+        for cluster, process in list(self.processes.items()):
+            if process.is_alive():
+                if time() - self.started[cluster] > STABLE_AFTER:
+                    self.crashes[cluster] = 0
+                running += 1
+                continue
+
+            self.stats.pop(cluster, None)
+            if process.exitcode == 0 and cluster not in self.restart_at:
+                # Clean logout, leave it down
+                log.info('Cluster %d exited', cluster)
+                del self.processes[cluster]
+                continue
+
+            if cluster not in self.restart_at:
+                self.crashes[cluster] = self.crashes.get(cluster, 0) + 1
+                delay = min(RESTART_DELAY * 2 ** (self.crashes[cluster] - 1), MAX_RESTART_DELAY)
+                self.restart_at[cluster] = time() + delay
+                log.error('Cluster %d crashed with exit code %s, restarting in %ds', cluster, process.exitcode, delay)
+            elif time() >= self.restart_at[cluster]:
+                del self.restart_at[cluster]
+                self.start(cluster)
+            running += 1
+
+        return running
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join()
+
+    def run(self):
+        try:
+            self.migrate()
+            for cluster in range(len(self.ranges)):
+                self.start(cluster)
+
+            while self.check():
+                sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Also reached when starting a cluster fails, so none are left without a supervisor
+            self.stop()
+            self.manager.shutdown()
+
+
+def launch_cluster(version, clusters, shard_count):
+    """Run the bot as several processes, each owning a range of shards"""
+
+    setup_logging(filename='harper/data/logs/supervisor.log')
+    Supervisor(version, clusters, shard_count).run()
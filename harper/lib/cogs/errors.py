@@ -2,6 +2,11 @@
 import discord
 from discord.ext import commands
 
+# Builtin modules
+from logging import getLogger, DEBUG, INFO
+
+log = getLogger(__name__)
+
 
 class Errors(commands.Cog):
     """Error handling module"""
@@ -11,6 +16,9 @@ class Errors(commands.Cog):
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
+        if not isinstance(error, commands.CommandNotFound):
+            self.client.telemetry.error(ctx, cooldown=isinstance(error, commands.CommandOnCooldown))
+
         if isinstance(error, commands.CommandOnCooldown):
             bucket = self.client.cooldown.get_bucket(ctx.message)
             retry_after = bucket.update_rate_limit()
@@ -28,7 +36,8 @@ class Errors(commands.Cog):
                 else:
                     value = f"You must wait `{int(h)} hours, {int(m)} minutes and {int(s)} seconds` to use this command!"
 
-                await ctx.send(f"Slow down {ctx.author.mention}! {value}")
+                self.client.dispatcher.send(ctx.channel, f"Slow down {ctx.author.mention}! {value}",
+                                            key=('cooldown', ctx.author.id), max_age=error.retry_after)
 
 
         elif isinstance(error, commands.CommandNotFound):
@@ -53,8 +62,22 @@ class Errors(commands.Cog):
                     embed.add_field(name=f"Error in {ctx.command}", value=f"`{ctx.command.qualified_name} {ctx.command.signature}` \n{error}")
             except:
                 embed.add_field(name=f"Error in {ctx.command}", value=f"{error}")
-            await ctx.send(embed=embed)
-        raise error
+            self.client.dispatcher.send(ctx.channel, embed=embed, key=('error', ctx.author.id, str(ctx.command)))
+        self.log(ctx, error)
+
+    def log(self, ctx, error):
+        """Queue the error for the log writer, with a traceback only when it is a bug rather than bad input"""
+
+        extra = {'command': str(ctx.command),
+                 'guild': ctx.guild.id if ctx.guild else None,
+                 'user': ctx.author.id}
+        original = getattr(error, 'original', error)
+
+        if isinstance(error, commands.CommandInvokeError) and not isinstance(original, commands.CommandError):
+            log.error('Error in %s', ctx.command, exc_info=(type(original), original, original.__traceback__), extra=extra)
+        else:
+            level = DEBUG if isinstance(error, (commands.CommandNotFound, commands.CommandOnCooldown)) else INFO
+            log.log(level, '%s in %s: %s', type(original).__name__, ctx.command, original, extra=extra)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -1,19 +1,91 @@
 import discord
 from discord.ext import commands
-import wolframalpha
+import re
+import csv
 import math
-import matplotlib.pyplot as plt
+import cmath
+from io import BytesIO
+from tempfile import NamedTemporaryFile
+from os import remove, replace, link, environ
+from pathlib import Path
+from time import perf_counter, time
+from typing import Optional
+from functools import partial
+from logging import getLogger
+from aiohttp import ClientSession
+from asyncio import get_event_loop, gather, Semaphore
+from apscheduler.triggers.interval import IntervalTrigger
+
+from harper.lib.utils.lazy import lazy
+from harper.lib.utils.cache import SizedLRUCache
+from harper.lib.utils.render import Renderer
+from harper.lib.utils.downloads import stream_to_disk, zip_to_disk
+from harper.lib.utils.evaluate import evaluate, equation, Unsupported
+
+log = getLogger(__name__)
+
+# Heavy plotting dependencies, imported on the first graph. Graphs render in worker
+# processes that import matplotlib themselves, so the bot process never pre-warms it
+np = lazy('numpy')
+figure = lazy('matplotlib.figure', warm=False)
+backend_agg = lazy('matplotlib.backends.backend_agg', warm=False)
+
+# Sample budget for one parabola
+POINTS = 512
+
+# Rendered answers cache
+CACHE_BYTES = 32 * 1024**2
+# One file per cluster, so clusters never write over each other
+CACHE_PATH = (f"harper/data/cache/quadratics-{environ['HARPER_CLUSTER']}.pickle" if 'HARPER_CLUSTER' in environ
+              else 'harper/data/cache/quadratics.pickle')
+# HARPER_PERSIST_CACHE=0 keeps benchmark runs away from the real cache file
+PERSIST_CACHE = environ.get('HARPER_PERSIST_CACHE', '1') == '1'
+
+# Homework uploads
+HOMEWORK_PATH = './homework'
+MAX_DOWNLOADS = 4
+CATALOG_PAGE = 15
+
+# Batch solver
+MAX_ROWS = 50000
+MAX_BATCH_BYTES = 4 * 1024**2
+TABLE_ROWS = 20
+BLOCK_ROWS = 10000
+BATCH_HEADER = ('a', 'b', 'c', 'root 1', 'root 2', 'vertex form', 'AOS')
+
+def normalize(values):
+    """Cache key for a coefficient triple, so 1 and 1.0 or 0 and -0.0 share an entry"""
+
+    return tuple(float(v) + 0.0 for v in values)
+
+def answer_size(entry):
+    answer, image = entry
+
+    return len(answer) + len(image)
 
 class Equation():
     def __init__(self, values):
         self.values = values
 
+    def get_discriminant(self):
+        a, b, c = self.values
+
+        return (b**2) - (4*a*c)
+
     def get_zeros(self):
         a, b, c = self.values
-        x = (b**2) - (4*a*c)
+        x = self.get_discriminant()
+
+        # Works on numpy arrays of coefficients too, roots are complex where x < 0
+        if hasattr(x, 'shape'):
+            root = np.emath.sqrt(x)
+        elif x < 0:
+            root = cmath.sqrt(x)
+        else:
+            root = math.sqrt(x)
 
-        x1 = (-b + math.sqrt(x)) / (2*a)
-        x2 = (-b - math.sqrt(x)) / (2*a)
+        x1 = (-b + root) / (2*a)
+        x2 = (-b - root) / (2*a)
 
         return x1, x2
 
@@ -37,22 +109,44 @@ class Equation():
 
         return f"{a}(x-{h})^2 + {k}"
     
-async def graph(equation):
-    a, b, c = equation.values
-    r1, r2 = equation.get_zeros()
+def window(equation):
+    """Plotting domain between the roots, or around the vertex without two real roots"""
+
+    if equation.get_discriminant() > 0:
+        return sorted(equation.get_zeros())
+
+    a = equation.values[0]
+    h, k = equation.get_vertex()
+    # Wide enough for the curve to climb at least one unit away from the vertex
+    half = math.sqrt(max(abs(k), 1) / abs(a))
 
-    if r1 < r2:
-        x = r1
-        y = r2
+    return h - half, h + half
 
+def sample(equation, points=POINTS, adaptive=True):
+    """Evaluate the parabola over its window in one vectorized pass"""
+
+    a, b, c = equation.values
+    start, stop = window(equation)
+
+    if adaptive:
+        # Spend the budget where the curve bends: point density follows
+        # sqrt(curvature) per unit of arc length, which is highest at the vertex
+        grid = np.linspace(start, stop, points * 4)
+        density = np.sqrt(abs(2*a)) * (1 + (2*a*grid + b)**2) ** -0.25
+        cdf = np.concatenate(([0.0], np.cumsum((density[1:] + density[:-1]) / 2)))
+        x = np.interp(np.linspace(0, cdf[-1], points), cdf, grid)
     else:
-        x = r2
-        y = r1
+        x = np.linspace(start, stop, points)
 
-    roots1 = []
-    roots2 = []
+    return x, (a*x + b)*x + c
 
-    fig = plt.figure()
+def graph(values):
+    """Render the parabola to PNG bytes, safe to run in a worker process"""
+
+    x, y = sample(Equation(values))
+
+    fig = figure.Figure()
+    backend_agg.FigureCanvasAgg(fig)
     ax = fig.add_subplot(1, 1, 1)
 
     # Set axes
@@ -65,15 +159,114 @@ async def graph(equation):
     ax.xaxis.set_ticks_position('bottom')
     ax.yaxis.set_ticks_position('left')
 
-    while x < y:
-        base = float((a*(x**2)) + (b*x) + c)
-
-        roots1.append(x)
-        roots2.append(base)
-        x += 0.0001
-
-    plt.plot(roots1, roots2, 'g')
-    plt.savefig('./harper/lib/images/quadratics.png')
+    ax.plot(x, y, 'g')
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def parse_rows(text, limit=None):
+    """Coefficient rows from pasted text or CSV, plus the line numbers that could not be read.
+
+    Stops after limit + 1 rows, enough to tell the input is over the limit.
+    """
+
+    rows, skipped = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        if limit is not None and len(rows) > limit:
+            break
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            a, b, c = map(float, re.split(r'[,;\s]+', line))
+        except ValueError:
+            # A header row such as "a,b,c" is expected, not an error
+            if rows or skipped:
+                skipped.append(number)
+            else:
+                skipped.append(None)
+            continue
+        rows.append((a, b, c))
+
+    if skipped and skipped[0] is None:
+        skipped.pop(0)
+
+    return rows, skipped
+
+def fmt(value, digits=6):
+    """Compact text for a real or complex number"""
+
+    if isinstance(value, complex):
+        if value.imag:
+            # + 0.0 turns -0.0 into 0.0, so nothing prints as -0
+            return f"{value.real + 0.0:.{digits}g}{value.imag + 0.0:+.{digits}g}i"
+        value = value.real
+
+    if isinstance(value, int):
+        # Exact while it fits in a message, the evaluator keeps anything past that within float range
+        return str(value) if abs(value) < 10**100 else f"{value:.{digits - 1}e}"
+
+    return f"{value + 0.0:.{digits}g}"
+
+def local_answer(question):
+    """Answer to plain arithmetic or a quadratic in x without asking Wolfram|Alpha, None otherwise"""
+
+    try:
+        return fmt(evaluate(question), digits=12)
+    except Unsupported:
+        pass
+
+    try:
+        a, b, c = equation(question)
+    except Unsupported:
+        return None
+
+    if a == 0:
+        return f"x = {fmt(-c / b, digits=12)}" if b else None
+
+    eq = Equation((a, b, c))
+    x1, x2 = eq.get_zeros()
+    x, y = eq.get_vertex()
+    roots = f"x = {fmt(x1)}" if x1 == x2 else f"x = {fmt(x1)} or x = {fmt(x2)}"
+    return f"{roots}\nVertex form: {fmt(a)}(x-{fmt(x)})^2 + {fmt(y)}\nVertex: ({fmt(x)}, {fmt(y)})\nAOS: x = {fmt(x)}"
+
+def solve_rows(rows):
+    """Solve rows of (a, b, c) with one vectorized Equation per block, yielding formatted rows"""
+
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = np.array(rows[start:start + BLOCK_ROWS], dtype=float)
+        eq = Equation(block.T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x1, x2 = eq.get_zeros()
+            h, k = eq.get_vertex()
+
+        for (a, b, c), r1, r2, vh, vk in zip(block.tolist(), x1.tolist(), x2.tolist(), h.tolist(), k.tolist()):
+            if a == 0:
+                yield (fmt(a), fmt(b), fmt(c), 'not a quadratic', '', '', '')
+            else:
+                yield (fmt(a), fmt(b), fmt(c), fmt(r1), fmt(r2), f"{fmt(a)}(x-{fmt(vh)})^2 + {fmt(vk)}", f"x = {fmt(vh)}")
+
+def parse_batch(text, files, limit=MAX_ROWS):
+    """parse_rows over the message text and every attached file, blocking"""
+
+    return parse_rows('\n'.join([text, *(data.decode('utf-8', errors='replace') for data in files)]), limit)
+
+def batch_csv(rows):
+    """Write a CSV of every solution to a temporary file block by block, returning its path. Blocking"""
+
+    with NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False) as file:
+        try:
+            writer = csv.writer(file)
+            writer.writerow(BATCH_HEADER)
+            writer.writerows(solve_rows(rows))
+        except BaseException:
+            file.close()
+            remove(file.name)
+            raise
+
+    return file.name
 
 class Homework(commands.Cog):
 
@@ -81,67 +274,348 @@ class Homework(commands.Cog):
 
     def __init__(self, client):
         self.client = client
+        # Workers import the plotting stack and draw a throwaway graph (loading fonts) when they start
+        self.renderer = Renderer(modules=('numpy', 'matplotlib.figure', 'matplotlib.backends.backend_agg'),
+                                 warmup=partial(graph, (1, 0, -1)))
+        self.downloads = Semaphore(MAX_DOWNLOADS)
+        self._saving = {}
+        self._session = None
+        self.cache = SizedLRUCache(CACHE_BYTES, sizeof=answer_size)
+
+        if PERSIST_CACHE:
+            path = Path(CACHE_PATH)
+            if path.exists():
+                try:
+                    self.cache.loads(path.read_bytes())
+                except Exception:
+                    # A cache is never worth failing to load the cog over
+                    log.warning('Discarding unreadable quadratics cache %s', CACHE_PATH, exc_info=True)
+                    self.cache.clear()
+
+            client.scheduler.add_job(self.save_cache, IntervalTrigger(minutes=10),
+                                     id='quadratics_cache', replace_existing=True)
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = ClientSession()
+        return self._session
+
+    def cog_unload(self):
+        self.renderer.shutdown()
+
+        if self._session is not None:
+            self.client.loop.create_task(self._session.close())
+
+        if PERSIST_CACHE:
+            self.client.scheduler.remove_job('quadratics_cache')
+            get_event_loop().run_in_executor(None, self.write_cache)
+
+    def write_cache(self):
+        """Pickle the cache into a temporary file and move it into place, so a crash never leaves half a file"""
+
+        # dumps copies the entries in one C call before pickling, so the loop can keep using the cache
+        data = self.cache.dumps()
+        path = Path(CACHE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=path.parent, suffix='.part', delete=False) as part:
+            try:
+                part.write(data)
+            except BaseException:
+                part.close()
+                remove(part.name)
+                raise
+        replace(part.name, path)
+
+    async def save_cache(self):
+        """Persist the quadratics cache without blocking the event loop on disk"""
+
+        await get_event_loop().run_in_executor(None, self.write_cache)
+
+    async def save_attachment(self, attachment, filename):
+        """Stream one attachment to disk as filename, returning its size and the stored copy it duplicates, if any"""
+
+        async with self.downloads:
+            digest, size, part = await stream_to_disk(self.session, attachment.url, HOMEWORK_PATH)
+
+        # Identical files in the same upload finish hashing before either is recorded
+        if digest in self._saving:
+            try:
+                duplicate = await self._saving[digest]
+            except Exception:
+                duplicate = None
+            await self.store(part, filename, digest, size, duplicate)
+            return size, duplicate
+
+        self._saving[digest] = saved = get_event_loop().create_future()
+        try:
+            existing = await self.client.db.fetchone('SELECT path FROM uploads WHERE sha256 = ?', (digest,))
+            duplicate = existing[0] if existing and Path(existing[0]).exists() else None
+            await self.store(part, filename, digest, size, duplicate)
+            saved.set_result(duplicate or filename)
+        except BaseException as error:
+            saved.set_exception(error)
+            raise
+        finally:
+            del self._saving[digest]
+
+        return size, duplicate
+
+    async def store(self, part, filename, digest, size, duplicate=None):
+        """Move a finished download into place as filename.
+
+        Every page keeps a file of its own, so saving over one page never changes
+        another. A duplicate becomes a hard link to the stored copy, sharing its disk
+        space, and keeps the downloaded copy where hard links are not supported.
+        """
+
+        if duplicate == filename:
+            remove(part)
+            return
+
+        if duplicate is not None:
+            try:
+                link(duplicate, f"{part}.link")
+            except OSError:
+                pass
+            else:
+                remove(part)
+                part = f"{part}.link"
+
+        # The file at filename is about to change, so no other digest may point at it
+        await self.client.db.execute('DELETE FROM uploads WHERE path = ? AND sha256 != ?', (filename, digest))
+        replace(part, filename)
+        if duplicate is None:
+            await self.client.db.execute('INSERT INTO uploads (sha256, path, size) VALUES (?, ?, ?) '
+                                         'ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, size = excluded.size',
+                                         (digest, filename, size))
 
     @commands.command(aliases=['d'])
     @commands.is_owner()
     async def download(self, ctx, day, page=1):
         
-        cur = await self.client.db.cursor()
-        await cur.execute('SELECT fullname, topic FROM homework WHERE id = ?', (ctx.author.id,))
-        name, topic = await cur.fetchone()
-        await cur.close()
+        name, topic = await self.client.db.fetchone('SELECT fullname, topic FROM homework WHERE id = ?', (ctx.author.id,))
+
+        Path(HOMEWORK_PATH).mkdir(parents=True, exist_ok=True)
+        # One page number per attachment so pages uploaded together never overwrite each other
+        filenames = [f"{HOMEWORK_PATH}/{name} - Day {day} {topic} Page #{page + i}{Path(attachment.filename).suffix}"
+                     for i, attachment in enumerate(ctx.message.attachments)]
+
+        start = perf_counter()
+        # Each attachment on its own, so one failed download does not cost the others their catalog entries
+        results = await gather(*(self.save_attachment(attachment, filename)
+                                 for attachment, filename in zip(ctx.message.attachments, filenames)),
+                               return_exceptions=True)
+        elapsed = perf_counter() - start
+
+        lines = []
+        saved = []
+        for i, (filename, result) in enumerate(zip(filenames, results)):
+            if isinstance(result, BaseException):
+                log.warning('Failed to save %s', filename, exc_info=result)
+                lines.append(f"Failed to save `{Path(filename).name}`")
+                continue
+
+            size, duplicate = result
+            saved.append((page + i, filename, size))
+            if duplicate == filename:
+                lines.append(f"`{Path(filename).name}` is already saved")
+            elif duplicate:
+                lines.append(f"Saved `{Path(filename).name}`, sharing its data with the identical `{Path(duplicate).name}`")
+            else:
+                lines.append(f"Saved `{Path(filename).name}`")
+
+        # Every page is catalogued under its own file, duplicates included
+        saved_at = int(time())
+        await gather(*(self.client.db.execute('INSERT INTO catalog (user, day, topic, page, path, size, saved_at) '
+                                              'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                                              'ON CONFLICT(user, day, topic, page) DO UPDATE SET '
+                                              'path = excluded.path, size = excluded.size, saved_at = excluded.saved_at',
+                                              (ctx.author.id, day, topic, number, path, size, saved_at))
+                       for number, path, size in saved))
+
+        total = sum(size for _, _, size in saved)
+        lines.append(f"`{len(saved)} file(s), {total / 1024**2:,.2f} MiB in {elapsed:.2f}s "
+                     f"({total / 1024**2 / max(elapsed, 1e-6):,.2f} MiB/s)`")
+        await ctx.send('\n'.join(lines))
+
+    async def catalog_page(self, ctx, where, params, after, more):
+        """Send one page of catalog entries, continuing after the entry with id after"""
+
+        # Keyset pagination on the (user, day, topic, page) index, so later pages cost the same as the first
+        sql = f"SELECT id, day, topic, page, path, size FROM catalog WHERE user = ? AND {where}"
+        params = (ctx.author.id, *params)
+        if after:
+            sql += ' AND (day, topic, page) > (SELECT day, topic, page FROM catalog WHERE id = ? AND user = ?)'
+            params += (after, ctx.author.id)
+        rows = await self.client.db.fetchall(sql + ' ORDER BY day, topic, page LIMIT ?', params + (CATALOG_PAGE + 1,))
+
+        if not rows:
+            await ctx.send('Nothing saved here yet.' if not after else 'No more pages.')
+            return
+
+        lines = [f"#{id:<6} Day {day:<6} {topic:<16} Page {page:<4} {(size or 0) / 1024:>8,.0f} KiB  {Path(path).name}"
+                 for id, day, topic, page, path, size in rows[:CATALOG_PAGE]]
+        content = '```\n' + '\n'.join(lines) + '\n```'
+        if len(rows) > CATALOG_PAGE:
+            content += f"Next page: `{ctx.prefix}{more} {rows[CATALOG_PAGE - 1][0]}`"
+        await ctx.send(content)
+
+    @commands.command(aliases=['hwlist'])
+    @commands.is_owner()
+    async def catalog(self, ctx, day='all', after: int=0):
+        """List your saved homework pages, for one day or all of them"""
+
+        if day == 'all':
+            await self.catalog_page(ctx, '1', (), after, f"catalog {day}")
+        else:
+            await self.catalog_page(ctx, 'day = ?', (day,), after, f"catalog {day}")
+
+    @commands.command(aliases=['hwsearch'])
+    @commands.is_owner()
+    async def catalog_search(self, ctx, query, after: int=0):
+        """Find saved homework pages by topic or day"""
 
-        filename = f"./homework/{name} - Day {day} {topic} Page #{page}"
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', query) + '%'
+        await self.catalog_page(ctx, "(topic LIKE ? ESCAPE '\\' OR day = ?)", (pattern, query), after,
+                                f"catalog_search \"{query}\"")
 
-        for attachment in ctx.message.attachments:
-            await attachment.save(filename + attachment.filename[-4:])
-            await ctx.send(f"Saved `{filename[11:]}`")
+    @commands.command(aliases=['hwexport'])
+    @commands.is_owner()
+    async def catalog_export(self, ctx, day):
+        """Download every saved page of one day as a zip archive"""
+
+        rows = await self.client.db.fetchall('SELECT path FROM catalog WHERE user = ? AND day = ? ORDER BY topic, page',
+                                             (ctx.author.id, day))
+        if not rows:
+            await ctx.send(f"Nothing saved for day {day}.")
+            return
+
+        await ctx.trigger_typing()
+        # Built on disk in a worker thread, one chunk at a time
+        archive = await get_event_loop().run_in_executor(None, zip_to_disk, [path for path, in rows], HOMEWORK_PATH)
+        try:
+            limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024**2
+            size = Path(archive).stat().st_size
+            if size > limit:
+                await ctx.send(f"Day {day} is {size / 1024**2:,.1f} MiB zipped, over the {limit / 1024**2:,.0f} MiB upload limit here.")
+            else:
+                await ctx.send(file=discord.File(archive, filename=f"Day {day}.zip"))
+        finally:
+            remove(archive)
 
     @commands.command(aliases=['conf-hw'])
     @commands.is_owner()
     async def config_homework(self, ctx, new_topic, *, new_name):
             
-        cur = await self.client.db.cursor()
-        await cur.execute('SELECT fullname, topic FROM homework WHERE id = ?', (ctx.author.id,))
-        name, topic = await cur.fetchone()
-        
-        if not name and not topic:
-            await cur.execute('INSERT INTO homework (id, fullname, topic) VALUES (?, ?, ?)', (ctx.author.id, new_name, new_topic))
-
-        else:
-            await cur.execute('UPDATE homework SET fullname = ?, topic = ? WHERE id = ?', (new_name, new_topic, ctx.author.id))
-        
-        await cur.close()
-        await self.client.db.commit()
+        await self.client.db.execute('INSERT INTO homework (id, fullname, topic) VALUES (?, ?, ?) '
+                                     'ON CONFLICT(id) DO UPDATE SET fullname = excluded.fullname, topic = excluded.topic',
+                                     (ctx.author.id, new_name, new_topic))
 
         await ctx.send(f"`New name: {new_name}\nNew topic: {new_topic}`")
     
     @commands.command(aliases=['quadratic'])
+    @commands.max_concurrency(1, per=commands.BucketType.user)
     async def quadratics(self, ctx, a: int, b: int, c: int):
         
         await ctx.trigger_typing()
 
-        eq = Equation((a, b, c))
-        
-        standard_form = eq.get_standard_form()
-        vertex_form = eq.get_vertex_form()
-        a, b, c = eq.values
-        x1, x2 = eq.get_zeros()
-        x, y = eq.get_vertex()
-        answer = "[+] Standard Form = {}\n[+] Vertex Form = {}\n[+] 1st zero/root = {}\n[+] 2nd zero/root = {}\n[+] Vertex = {}\n[+] AOS: x = {}".format(standard_form, vertex_form, x1, x2, (x, y), x)
-        await graph(eq)
-
-        await ctx.send(content=answer, file=discord.File('./harper/lib/images/quadratics.png'))
+        key = normalize((a, b, c))
+        cached = self.cache.get(key)
+
+        if cached is None:
+            eq = Equation((a, b, c))
+
+            standard_form = eq.get_standard_form()
+            vertex_form = eq.get_vertex_form()
+            a, b, c = eq.values
+            x1, x2 = eq.get_zeros()
+            x, y = eq.get_vertex()
+            answer = "[+] Standard Form = {}\n[+] Vertex Form = {}\n[+] 1st zero/root = {}\n[+] 2nd zero/root = {}\n[+] Vertex = {}\n[+] AOS: x = {}".format(standard_form, vertex_form, x1, x2, (x, y), x)
+            image = await self.renderer.render(graph, eq.values)
+
+            self.cache.put(key, (answer, image))
+        else:
+            answer, image = cached
+
+        await ctx.send(content=answer, file=discord.File(BytesIO(image), filename='quadratics.png'))
+
+    @commands.command(aliases=['qbatch', 'worksheet'])
+    @commands.max_concurrency(1, per=commands.BucketType.user)
+    async def quadratics_batch(self, ctx, *, rows: Optional[str]=None):
+        """Solve a whole worksheet. One `a b c` row per line, or attach a CSV"""
+
+        size = sum(attachment.size for attachment in ctx.message.attachments)
+        if size > MAX_BATCH_BYTES:
+            await ctx.send(f"That is {size / 1024**2:,.1f} MiB of rows, I can read up to {MAX_BATCH_BYTES / 1024**2:,.0f} MiB at a time.")
+            return
+
+        files = [await attachment.read() for attachment in ctx.message.attachments]
+        parsed, skipped = await get_event_loop().run_in_executor(None, parse_batch, rows or '', files)
+        if skipped:
+            await ctx.send(f"Skipped {len(skipped):,} line(s) that are not three numbers: {', '.join(map(str, skipped[:20]))}"
+                           + (' ...' if len(skipped) > 20 else ''))
+        if not parsed:
+            await ctx.send('Give me at least one row of `a b c` coefficients.')
+            return
+        if len(parsed) > MAX_ROWS:
+            await ctx.send(f"That is over {MAX_ROWS:,} rows, I can solve up to {MAX_ROWS:,} at a time.")
+            return
+
+        await ctx.trigger_typing()
+
+        if len(parsed) <= TABLE_ROWS:
+            solved = [BATCH_HEADER, *solve_rows(parsed)]
+            widths = [max(len(row[i]) for row in solved) for i in range(len(BATCH_HEADER))]
+            lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in solved]
+
+            # Send each message as soon as it is full instead of building one reply
+            chunk = []
+            for line in lines:
+                if sum(len(l) + 1 for l in chunk) + len(line) > 1900:
+                    await ctx.send('```\n' + '\n'.join(chunk) + '\n```')
+                    chunk = []
+                chunk.append(line)
+            await ctx.send('```\n' + '\n'.join(chunk) + '\n```')
+        else:
+            path = await get_event_loop().run_in_executor(None, batch_csv, parsed)
+            try:
+                await ctx.send(content=f"Solved **{len(parsed):,}** quadratics.",
+                               file=discord.File(path, filename='quadratics.csv'))
+            finally:
+                remove(path)
+
+    @commands.command(aliases=['qcache'], hidden=True)
+    @commands.is_owner()
+    async def graphcache(self, ctx, action: Optional[str]=None):
+        """Quadratics cache statistics. Pass `clear` to empty it"""
+
+        if action == 'clear':
+            self.cache.clear()
+
+        stats = self.cache.stats()
+        await ctx.send(f"`Entries: {stats['size']:,}\n"
+                       f"Memory: {stats['bytes'] / 1024**2:,.2f} / {stats['maxbytes'] / 1024**2:,.0f} MiB\n"
+                       f"Hits: {stats['hits']:,}\n"
+                       f"Misses: {stats['misses']:,}\n"
+                       f"Hit rate: {stats['hit_rate']:.1%}\n"
+                       f"Evictions: {stats['evictions']:,}`")
     
     @commands.command(aliases=['wlfram'])
     @commands.cooldown(1, 10, commands.BucketType.user)
     async def wolfram(self, ctx, *, question):
 
+        answer = local_answer(question)
+        if answer is not None:
+            # Nothing was asked of Wolfram|Alpha, so this should not cost the cooldown
+            ctx.command.reset_cooldown(ctx)
+            self.client.wolfram.local += 1
+            await ctx.send(answer)
+            return
+
         await ctx.trigger_typing()
   
-        wolfram = wolframalpha.Client(self.client.wolfram_id) 
-        res = wolfram.query(question) 
-        answer = next(res.results).text 
+        answer = await self.client.wolfram.query(question)
 
         await ctx.send(answer)
 
@@ -3,17 +3,21 @@ import discord
 from aiosqlite import connect
 from discord.ext import commands
 from typing import Optional, Union
-from apscheduler.triggers.cron import CronTrigger
-from psutil import Process, virtual_memory, cpu_percent
+from apscheduler.triggers.interval import IntervalTrigger
 
 # Builtin modules
+from io import BytesIO
 from os import getcwd
 from time import time
 from random import choice
-from json import load, dump
+from json import load, dump, dumps
+from logging import getLogger
+from traceback import format_list
 from platform import python_version
 from datetime import datetime, timedelta
 
+log = getLogger(__name__)
+
 
 class Meta(commands.Cog):
 
@@ -21,15 +25,17 @@ class Meta(commands.Cog):
 
     def __init__(self, client):
         self.client = client
-        self._message = 'playing a game | {guilds:,} servers & {users:,} users | version {version:s}'
 
-        client.scheduler.add_job(self.set, CronTrigger(second=0))
+        client.scheduler.add_job(client.sampler.sample, IntervalTrigger(seconds=15),
+                                 id='sample_metrics', replace_existing=True)
+        client.scheduler.add_job(self.reconcile, IntervalTrigger(minutes=30),
+                                 id='reconcile_counters', replace_existing=True)
 
     @property
     def message(self):
         """Status formatter"""
 
-        return self._message.format(guilds=len(self.client.guilds), users=len(set(self.client.get_all_members())), version=self.client.version)
+        return self.client.presence.status
 
     @message.setter
     def message(self, value):
@@ -37,21 +43,20 @@ class Meta(commands.Cog):
 
         if value.split(' ')[0] not in ('playing', 'watching', 'listening-to', 'streaming'):
             raise ValueError('Invalid discord.Activity type.')
-        self._message = value
+        self.client.presence.template = value
 
-    async def set(self):
-        """Set the current bot status"""
+    async def reconcile(self):
+        """Correct any drift in the member and guild counters"""
 
-        try:
-            _type, _name = self.message.split(' ', maxsplit=1)
+        guilds, users = self.client.counter.reconcile(self.client.guilds)
+        if guilds or users:
+            log.warning('Counters drifted by %+d servers and %+d users', guilds, users)
+            self.client.presence.invalidate()
 
-        except ValueError:
-            _type = 'watching'
-            _name = self.message
+    async def set(self):
+        """Set the current bot status"""
 
-        await self.client.change_presence(activity=discord.Activity(name=_name, 
-        type=getattr(discord.ActivityType, _type, discord.ActivityType.watching),
-        ))
+        await self.client.presence.flush()
 
     @commands.command(aliases=['status'], hidden=True)
     @commands.is_owner()
@@ -62,10 +67,7 @@ class Meta(commands.Cog):
         if not status:
             status = 'watching @GuhBot | {guilds:,} servers & {users:,} users | version {version:s}'
 
-        self._message = status
-
-        for job in self.client.scheduler.get_jobs():
-            job.modify(next_run_time=datetime.now())
+        self.client.presence.template = status
 
         await ctx.send(f"Set status to `{status}`")
     
@@ -77,6 +79,7 @@ class Meta(commands.Cog):
 
         for job in self.client.scheduler.get_jobs():
             job.modify(next_run_time=datetime.now())
+        self.client.presence.invalidate()
 
         await ctx.send('Updated all schedules')
 
@@ -85,20 +88,11 @@ class Meta(commands.Cog):
     async def help(self, ctx, *cog):
         """Displays this message"""
 
+        index = self.client.help_index
         if not cog:
-            embed = discord.Embed(title='🔧 Module List',
-                                  description=f"Do `{await self.client.prefix(ctx.message)}help [module]` for more info on a specific module.",
-                                  colour=ctx.author.colour,
-                                  timestamp=ctx.message.created_at)
-
-            cog_list = []
-            for x in self.client.cogs:
-                if x.lower() in ('errors', 'events'):
-                    pass
-                else:
-                    cog_list.append((x, self.client.cogs[x].__doc__, False))
-            for name, value, inline in cog_list:
-                embed.add_field(name=name, value=value, inline=inline)
+            embed = index.render(index.modules, await self.client.prefix(ctx.message))
+            embed.colour = ctx.author.colour
+            embed.timestamp = ctx.message.created_at
             embed.set_author(name=f"{ctx.author.name}#{ctx.author.discriminator}",
                              icon_url=ctx.author.avatar_url)
             embed.set_thumbnail(url=self.client.user.avatar_url)
@@ -114,59 +108,23 @@ class Meta(commands.Cog):
                 embed.set_thumbnail(url=self.client.user.avatar_url)
                 await ctx.send(embed=embed)
             else:
-                found = False
-                for x in self.client.cogs:
-                    for y in cog:
-                        if x.lower() == y.lower():
-                            embed = discord.Embed(title=f"🚧 {str(x).title()} Command List",
-                                                  description=f"**{str(x).title()} - {self.client.cogs[x].__doc__}**\nDo `{await self.client.prefix(ctx.message)}help [command]` for more info on a command",
-                                                  colour=ctx.author.colour,
-                                                  timestamp=ctx.message.created_at)
-
-                            command_list = []
-                            for c in self.client.get_cog(y.capitalize()).get_commands():
-                                if not c.hidden:
-                                    if c.signature:
-                                        command_list.append((f"`{c.qualified_name} {c.signature}`", f"{c.help}", False))
-                                    else:
-                                        command_list.append((f"`{c.qualified_name}`", f"{c.help}", False))
-                            for name, value, inline in command_list:
-                                embed.add_field(name=name, value=value, inline=inline)
-                            embed.set_author(name=f"{ctx.author.name}#{ctx.author.discriminator}",
-                                             icon_url=ctx.author.avatar_url)
-                            embed.set_thumbnail(url=self.client.user.avatar_url)
-                            found = True
-                if not found:
-                    for x in self.client.cogs:
-                        for c in self.client.get_cog(x).get_commands():
-                            if c.name == cog[0].lower():
-                                embed = discord.Embed(title='🔧 Command Syntax',
-                                                      description='H.A.R.P.E.R.\'s commands and how to use them.',
-                                                      colour=ctx.author.colour,
-                                                      timestamp=ctx.message.created_at)
-                                embed.add_field(name=f"{c.name} - {c.help}",
-                                                value=f"Proper Syntax:\n`{c.qualified_name} {c.signature}`",
-                                                inline=False)
-                                if c.aliases == [] or c.aliases == [None]:
-                                    c.aliases.clear()
-                                    c.aliases.append('No Aliases')
-                                embed.add_field(name='Command Aliases',
-                                                value=', '.join(c.aliases),
-                                                inline=False)
-                                embed.set_author(name=f"{ctx.author.name}#{ctx.author.discriminator}",
-                                                 icon_url=ctx.author.avatar_url)
-                                embed.set_thumbnail(url=self.client.user.avatar_url)
-                        found = True
-                else:
-                    await ctx.message.add_reaction(emoji='👍')
-                try:
-                    await ctx.send(embed=embed)
-                except UnboundLocalError:
+                found = index.lookup(cog[0], await self.client.prefix(ctx.message))
+                if found is None:
                     embed = discord.Embed(title='⛔ Error!',
                                           description=f"How would you even use the command or module \"**{cog[0]}**\"?\nSorry, but I don\'t see a command or module called \"**{cog[0]}**\"",
                                           colour=self.client.colours['RED'],
                                           timestamp=ctx.message.created_at)
                     await ctx.send(embed=embed)
+                else:
+                    kind, embed = found
+                    embed.colour = ctx.author.colour
+                    embed.timestamp = ctx.message.created_at
+                    embed.set_author(name=f"{ctx.author.name}#{ctx.author.discriminator}",
+                                     icon_url=ctx.author.avatar_url)
+                    embed.set_thumbnail(url=self.client.user.avatar_url)
+                    if kind == 'cog':
+                        await ctx.message.add_reaction(emoji='👍')
+                    await ctx.send(embed=embed)
 
     @commands.command(aliases=['change_prefix'])
     @commands.cooldown(1, 10, commands.BucketType.guild)
@@ -187,25 +145,34 @@ class Meta(commands.Cog):
             await ctx.send(embed=embed)
 
         else:
-            cur = await self.client.db.cursor()
-            await cur.execute('SELECT prefix FROM prefixes WHERE id = ?', (ctx.guild.id,))
-            prefix = await cur.fetchone()
-
-            if not prefix:
-                if not new_prefix == 'guh ':
-                    await cur.execute('INSERT INTO prefixes (id, prefix) VALUES (?, ?)', (ctx.guild.id, new_prefix))
-
+            # Write-through so get_prefix never has to hit the database
+            if new_prefix == 'guh ':
+                await self.client.db.execute('DELETE FROM prefixes WHERE id = ?', (ctx.guild.id,))
+                self.client.prefixes.reset(ctx.guild.id)
             else:
-                if new_prefix =='guh ':
-                    await cur.execute('DELETE FROM prefixes WHERE id = ?', (ctx.guild.id,))
-                else:  
-                    await cur.execute('UPDATE prefixes SET prefix = ? WHERE id = ?', (new_prefix, ctx.guild.id))
-            
-            await cur.close()
-            await self.client.db.commit()
+                await self.client.db.execute('INSERT INTO prefixes (id, prefix) VALUES (?, ?) '
+                                             'ON CONFLICT(id) DO UPDATE SET prefix = excluded.prefix', (ctx.guild.id, new_prefix))
+                self.client.prefixes.update(ctx.guild.id, new_prefix)
 
             await ctx.send(f"Set the custom prefix to `{new_prefix}`\nDo `{new_prefix}prefix` to set it back to the default prefix.\nPing {self.client.user.mention} to check the current prefix.")
 
+    def shards(self):
+        """Per-shard latency and server counts, across every cluster when clustered"""
+
+        if self.client.cluster_stats:
+            shards = {}
+            for cluster in dict(self.client.cluster_stats).values():
+                shards.update(cluster['shards'])
+        elif hasattr(self.client, 'latencies'):
+            shards = {shard_id: {'latency': latency, 'guilds': 0} for shard_id, latency in self.client.latencies}
+            for guild in self.client.guilds:
+                shards[guild.shard_id]['guilds'] += 1
+        else:
+            return None
+
+        return '\n'.join(f"Shard {shard_id}: **{shard['guilds']:,d}** servers, **{shard['latency'] * 1000:,.0f}ms**"
+                         for shard_id, shard in sorted(shards.items()))[:1024]
+
     @commands.command(aliases=['statistics', 'info'])
     @commands.cooldown(1, 8, commands.BucketType.user)
     async def stats(self, ctx):
@@ -220,19 +187,24 @@ class Meta(commands.Cog):
         prefix = await self.client.prefix(ctx.message)
         botUsername = self.client.user.name
         websocketLatency = round(self.client.latency * 1000, 3)
-        serverCount = len(self.client.guilds)
-        memberCount = len(set(self.client.get_all_members()))
+        serverCount = self.client.counter.guilds
+        memberCount = self.client.counter.users
+        shards = self.shards()
+        if self.client.cluster_stats:
+            clusters = dict(self.client.cluster_stats)
+            serverCount = sum(cluster['guilds'] for cluster in clusters.values())
+            # Users in servers on different clusters are counted once per cluster
+            memberCount = sum(cluster['users'] for cluster in clusters.values())
         botVersion = self.client.version
         pythonVer = python_version()
         dpyVer = discord.__version__
-        proc = Process()
-        with proc.oneshot():
-            uptime = timedelta(seconds=time()-proc.create_time())
-            cpu_time = timedelta(seconds=(proc.cpu_times()).system + proc.cpu_times().user)
-            cpu_usage = f"**{cpu_percent()}%**"
-            mem_total = virtual_memory().total / (1024**2)
-            mem_of_total = proc.memory_percent()
-            mem_usage = mem_total * (mem_of_total / 100)
+        sample = self.client.sampler.latest or await self.client.sampler.sample()
+        uptime = timedelta(seconds=time()-self.client.sampler.started)
+        cpu_time = timedelta(seconds=sample.cpu_time)
+        cpu_usage = f"**{sample.cpu_percent}%**"
+        mem_total = sample.memory_total / (1024**2)
+        mem_of_total = sample.memory_percent
+        mem_usage = sample.rss / (1024**2)
 
         ping_title = choice(['🏓 Pong', '🏓 Ping'])
         content = ''
@@ -262,6 +234,8 @@ class Meta(commands.Cog):
                   ('💾 CPU Time', strfdelta(cpu_time, "{days} day(s)\n{hours} hour(s)\n{minutes} minute(s)\n{seconds} second(s)"), True),
                   ('⚙️ CPU Usage', cpu_usage, True),
                   ('💽 Memory Usage', f"{mem_usage:,.3f} / {mem_total:,.0f} MiB ({mem_of_total:.0f}%)", True)]
+        if shards:
+            fields.append(('🧩 Shards', shards, False))
         
         for name, value, inline in fields:
             embed.add_field(name=name, value=value, inline=inline)
@@ -298,8 +272,14 @@ class Meta(commands.Cog):
         """This command disconnects the bot from all services."""
 
         await ctx.send(f":wave: Goodbye {ctx.author.mention}! I'm shutting dow...")
+        await self.client.wolfram.close()
+        self.client.watchdog.stop()
+        await self.client.metrics.stop()
+        await self.client.db.close()
         await self.client.close()
-        raise SystemExit(f"{self.client.user.name} was logged out.")
+        log.info('%s was logged out.', self.client.user.name)
+        # A clean exit code, so the cluster supervisor leaves a logged out cluster down
+        raise SystemExit(0)
 
     @logout.error
     async def logout_error(self, ctx, error):
@@ -317,6 +297,41 @@ class Meta(commands.Cog):
         else:
             raise error
     
+    @commands.command(aliases=['histograms'], hidden=True)
+    @commands.is_owner()
+    async def timings(self, ctx, export: Optional[str]=None):
+        """Command latency percentiles. Pass `json` to download everything recorded"""
+
+        if export == 'json':
+            data = dumps(self.client.telemetry.export(), indent=2).encode('utf-8')
+            await ctx.send(file=discord.File(BytesIO(data), filename='timings.json'))
+        else:
+            await ctx.send(f"```\n{self.client.telemetry.table()}\n```")
+
+    @commands.command(aliases=['lag'], hidden=True)
+    @commands.is_owner()
+    async def stalls(self, ctx, number: Optional[int]=None):
+        """Recent event loop stalls and what was running. Pass a number for its stack"""
+
+        watchdog = self.client.watchdog
+        if number is not None:
+            stalls = list(reversed(watchdog.stalls))
+            if not 0 < number <= len(stalls):
+                await ctx.send(f"There are only {len(stalls)} stalls recorded.")
+                return
+            stack = ''.join(format_list(stalls[number - 1].stack))
+            await ctx.send(f"```py\n{stack[-1900:]}\n```")
+            return
+
+        lag = watchdog.lag.summary()
+        lines = [f"Loop lag p50 {lag['p50'] * 1000:,.1f} ms, p99 {lag['p99'] * 1000:,.1f} ms, max {lag['max'] * 1000:,.0f} ms. "
+                 f"{watchdog.count:,} stalls over {watchdog.threshold * 1000:,.0f} ms"]
+        lines += watchdog.lines() or ['No stalls recorded.']
+        if watchdog.slow:
+            lines.append('Slow callbacks:')
+            lines += [f"<t:{at:.0f}:R> **{duration * 1000:,.0f} ms** `{handle}`" for at, duration, handle in list(watchdog.slow)[-5:]]
+        await ctx.send('\n'.join(lines)[:2000])
+
     @commands.command()
     async def about(self, ctx):
         await ctx.send('H.A.R.P.E.R. Homework Assistant Robot Personal Experimental Resource')
@@ -327,6 +342,7 @@ class Meta(commands.Cog):
         """Cog loader"""
 
         self.client.load_extension(f"harper.lib.cogs.{cog}")
+        self.client.help_index.build(self.client)
         await ctx.send(f"`{cog} loaded successfully.`")
 
     @commands.command(hidden=True)
@@ -335,6 +351,7 @@ class Meta(commands.Cog):
         """Cog unloader"""
 
         self.client.unload_extension(f"harper.lib.cogs.{cog}")
+        self.client.help_index.build(self.client)
         await ctx.send(f"`{cog} unloaded successfully.`")
 
     @commands.command(hidden=True)
@@ -344,10 +361,35 @@ class Meta(commands.Cog):
 
         self.client.unload_extension(f"harper.lib.cogs.{cog}")
         self.client.load_extension(f"harper.lib.cogs.{cog}")
+        self.client.help_index.build(self.client)
         await ctx.send(f"`{cog} reloaded successfully.`")
 
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.client.counter.add_member(member)
+        self.client.presence.invalidate()
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.client.counter.remove_member(member)
+        self.client.presence.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.client.counter.add_guild(guild)
+        self.client.presence.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.client.counter.remove_guild(guild)
+        self.client.presence.invalidate()
+
     @commands.Cog.listener()
     async def on_ready(self):
+        self.client.counter.reconcile(self.client.guilds)
+        # on_ready means a new session after IDENTIFY, which does not keep the last status, unlike a resume
+        self.client.presence.reset()
+
         if not self.client.ready:
             self.client.cogs_ready.ready_up('Meta')
 
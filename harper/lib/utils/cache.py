@@ -0,0 +1,147 @@
+# Builtin modules
+from time import monotonic
+from pickle import dumps, loads
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache(object):
+    """Size bounded least-recently-used mapping with hit/miss counters"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Look up a key and mark it as most recently used"""
+
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Insert or replace a key, evicting the least recently used entries"""
+
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._evict()
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def dumps(self):
+        """Serialize the entries, least recently used first"""
+
+        return dumps(list(self._data.items()))
+
+    def loads(self, data):
+        """Restore entries written by dumps"""
+
+        for key, value in loads(data):
+            self.put(key, value)
+
+    def _evict(self):
+        self._data.popitem(last=False)
+        self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Counters snapshot"""
+
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hit_rate}
+
+
+class SizedLRUCache(LRUCache):
+    """LRU cache bounded by the total size of its values in bytes"""
+
+    def __init__(self, maxbytes, sizeof=len, maxsize=float('inf')):
+        super().__init__(maxsize=maxsize)
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._sizes = {}
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.maxbytes:
+            return
+
+        self.pop(key)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        while self.nbytes > self.maxbytes or len(self._data) > self.maxsize:
+            self._evict()
+
+    def pop(self, key, default=None):
+        if key in self._sizes:
+            self.nbytes -= self._sizes.pop(key)
+        return super().pop(key, default)
+
+    def clear(self):
+        super().clear()
+        self._sizes.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        key, _ = self._data.popitem(last=False)
+        self.nbytes -= self._sizes.pop(key)
+        self.evictions += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(bytes=self.nbytes, maxbytes=self.maxbytes)
+        return stats
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries expire after a fixed number of seconds"""
+
+    def __init__(self, ttl, maxsize=1024):
+        super().__init__(maxsize=maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key, MISSING)
+        if entry is MISSING:
+            return default
+
+        expires, value = entry
+        if expires < monotonic():
+            self._data.pop(key)
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def put(self, key, value):
+        super().put(key, (monotonic() + self.ttl, value))
@@ -0,0 +1,80 @@
+# Builtin modules
+from collections import Counter
+
+
+class MemberCounter(object):
+    """Unique user and guild counts kept up to date from gateway events.
+
+    With exact=False, for member cache policies that do not hold every member,
+    users is the sum of each guild's member_count instead of a count of unique users.
+    """
+
+    def __init__(self, exact=True):
+        self.exact = exact
+        # user id -> number of guilds we share with them
+        self._users = Counter()
+        # guild id -> member count, when not exact
+        self._totals = {}
+        self._total = 0
+        self._guilds = set()
+
+    @property
+    def users(self):
+        return len(self._users) if self.exact else self._total
+
+    @property
+    def guilds(self):
+        return len(self._guilds)
+
+    def add_member(self, member):
+        if self.exact:
+            self._users[member.id] += 1
+        elif member.guild.id in self._totals:
+            self._totals[member.guild.id] += 1
+            self._total += 1
+
+    def remove_member(self, member):
+        if self.exact:
+            self._users[member.id] -= 1
+            if self._users[member.id] <= 0:
+                del self._users[member.id]
+        elif member.guild.id in self._totals:
+            self._totals[member.guild.id] -= 1
+            self._total -= 1
+
+    def add_guild(self, guild):
+        if guild.id in self._guilds:
+            return
+
+        self._guilds.add(guild.id)
+        if self.exact:
+            for member in guild.members:
+                self.add_member(member)
+        else:
+            self._totals[guild.id] = guild.member_count or 0
+            self._total += self._totals[guild.id]
+
+    def remove_guild(self, guild):
+        if guild.id not in self._guilds:
+            return
+
+        self._guilds.discard(guild.id)
+        if self.exact:
+            for member in guild.members:
+                self.remove_member(member)
+        else:
+            self._total -= self._totals.pop(guild.id, 0)
+
+    def reconcile(self, guilds):
+        """Rebuild from the gateway's guild data, returning how far the counts had drifted"""
+
+        before = (self.guilds, self.users)
+
+        self._users.clear()
+        self._totals.clear()
+        self._total = 0
+        self._guilds.clear()
+        for guild in guilds:
+            self.add_guild(guild)
+
+        return self.guilds - before[0], self.users - before[1]
@@ -0,0 +1,126 @@
+# 3rd party modules
+from aiosqlite import connect
+
+# Builtin modules
+from time import perf_counter
+from asyncio import Queue, Lock, get_event_loop
+
+# Local modules
+from harper.lib.utils.metrics import Histogram, timed_db
+
+
+class Database(object):
+    """SQLite access layer: WAL mode, a pool of read connections and one group-committing writer"""
+
+    def __init__(self, path, readers=4, window=0.005, cached_statements=256):
+        self.path = path
+        self.readers = readers
+        self.window = window
+        self.cached_statements = cached_statements
+        self.writer = None
+        self._pool = Queue()
+        self._connections = []
+        self._write_lock = Lock()
+        self._pending = []
+        self._flush = None
+        self.waiting = 0
+        self.read_latency = Histogram()
+        self.write_latency = Histogram()
+        self.commit_size = Histogram()
+
+    async def _open(self):
+        # sqlite3 keeps a per-connection cache of prepared statements keyed on the SQL text
+        conn = await connect(self.path, cached_statements=self.cached_statements)
+        self._connections.append(conn)
+        return conn
+
+    async def connect(self):
+        self.writer = await self._open()
+        await self.writer.execute('PRAGMA journal_mode=WAL')
+        await self.writer.execute('PRAGMA synchronous=NORMAL')
+
+        for _ in range(self.readers):
+            reader = await self._open()
+            await reader.execute('PRAGMA query_only=ON')
+            self._pool.put_nowait(reader)
+
+    async def close(self):
+        if self._pending:
+            await self._commit()
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+
+    async def _read(self, sql, params, one):
+        start = perf_counter()
+        async with timed_db():
+            self.waiting += 1
+            try:
+                conn = await self._pool.get()
+            finally:
+                self.waiting -= 1
+
+            try:
+                cur = await conn.execute(sql, params)
+                rows = await (cur.fetchone() if one else cur.fetchall())
+                await cur.close()
+            finally:
+                self._pool.put_nowait(conn)
+
+        self.read_latency.record(perf_counter() - start)
+        return rows
+
+    async def fetchone(self, sql, params=()):
+        return await self._read(sql, params, one=True)
+
+    async def fetchall(self, sql, params=()):
+        return await self._read(sql, params, one=False)
+
+    async def execute(self, sql, params=()):
+        """Run a write, returning its rowcount once the group it joined has committed"""
+
+        start = perf_counter()
+        async with timed_db():
+            async with self._write_lock:
+                cur = await self.writer.execute(sql, params)
+                rowcount = cur.rowcount
+                await cur.close()
+
+            # Writes landing within the window share one commit
+            future = get_event_loop().create_future()
+            self._pending.append(future)
+            if self._flush is None:
+                self._flush = get_event_loop().call_later(self.window, lambda: get_event_loop().create_task(self._commit()))
+            await future
+
+        self.write_latency.record(perf_counter() - start)
+        return rowcount
+
+    async def _commit(self):
+        async with self._write_lock:
+            if self._flush is not None:
+                self._flush.cancel()
+                self._flush = None
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            self.commit_size.record(len(pending))
+            try:
+                await self.writer.commit()
+            except Exception as error:
+                await self.writer.rollback()
+                for future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for future in pending:
+                    if not future.done():
+                        future.set_result(None)
+
+    def stats(self):
+        return {'read_queue_depth': self.waiting,
+                'pending_writes': len(self._pending),
+                'read_latency': self.read_latency.summary(),
+                'write_latency': self.write_latency.summary(),
+                'commit_size': self.commit_size.summary()}
@@ -0,0 +1,130 @@
+# 3rd party modules
+import discord
+
+# Builtin modules
+from time import monotonic
+from logging import getLogger
+from asyncio import sleep, ensure_future
+from collections import OrderedDict
+
+# Local modules
+from harper.lib.utils.metrics import Histogram
+
+log = getLogger(__name__)
+
+
+class TokenBucket(object):
+    """Refills rate tokens per second up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available"""
+
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class Outgoing(object):
+    """One queued message"""
+
+    __slots__ = ('kwargs', 'queued', 'updated', 'max_age')
+
+    def __init__(self, kwargs, max_age):
+        self.kwargs = kwargs
+        self.queued = self.updated = monotonic()
+        self.max_age = max_age
+
+
+class Dispatcher(object):
+    """Outbound messages, one queue per channel.
+
+    Messages queued with the same key while an earlier one is still waiting replace it,
+    messages older than their max_age are dropped, and each channel is paced by a token
+    bucket sized to Discord's per-channel message rate limit (5 per 5 seconds).
+    """
+
+    def __init__(self, rate=1.0, burst=5, max_age=15.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_age = max_age
+        self.queues = {}
+        self.buckets = {}
+        self.workers = {}
+        self.latency = Histogram()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def send(self, channel, content=None, *, key=None, max_age=None, **kwargs):
+        """Queue a message for channel, replacing a pending message with the same key"""
+
+        queue = self.queues.setdefault(channel.id, OrderedDict())
+        kwargs['content'] = content
+        if key is None:
+            key = object()
+
+        pending = queue.get(key)
+        if pending is not None:
+            # Keep its place in line and its original queue time, send the newest content
+            pending.kwargs = kwargs
+            pending.updated = monotonic()
+            self.coalesced += 1
+        else:
+            queue[key] = Outgoing(kwargs, max_age or self.max_age)
+
+        if channel.id not in self.workers:
+            self.workers[channel.id] = ensure_future(self._drain(channel))
+
+    async def _drain(self, channel):
+        queue = self.queues[channel.id]
+        bucket = self.buckets.setdefault(channel.id, TokenBucket(self.rate, self.burst))
+
+        try:
+            while queue:
+                delay = bucket.delay()
+                if delay:
+                    # Anything queued meanwhile can still be merged into a waiting message
+                    await sleep(delay)
+                    continue
+
+                _, message = queue.popitem(last=False)
+                if monotonic() - message.updated > message.max_age:
+                    self.dropped += 1
+                    continue
+
+                bucket.take()
+                try:
+                    await channel.send(**message.kwargs)
+                except discord.HTTPException as error:
+                    log.warning('Could not send to channel %s: %s', channel.id, error)
+                else:
+                    self.sent += 1
+                self.latency.record(monotonic() - message.queued)
+        finally:
+            del self.workers[channel.id]
+            if not queue:
+                # Idle channels keep no state, a new bucket starts full anyway
+                del self.queues[channel.id]
+                del self.buckets[channel.id]
+
+    def stats(self):
+        return {'queued': sum(len(queue) for queue in self.queues.values()),
+                'channels': len(self.workers),
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'latency': self.latency.summary()}
@@ -0,0 +1,64 @@
+# Builtin modules
+from os import remove
+from pathlib import Path
+from hashlib import sha256
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+CHUNK_SIZE = 64 * 1024
+
+# Already compressed formats, deflating them again only costs CPU
+STORED = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.heic', '.pdf', '.zip', '.docx', '.pptx', '.xlsx'}
+
+
+async def stream_to_disk(session, url, directory, chunk_size=CHUNK_SIZE):
+    """Stream a URL into a temporary file in directory, hashing it on the way.
+
+    Returns the hex SHA-256 digest, the size in bytes and the temporary file's path.
+    """
+
+    digest = sha256()
+    size = 0
+
+    with NamedTemporaryFile(dir=directory, suffix='.part', delete=False) as part:
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    digest.update(chunk)
+                    part.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            part.close()
+            remove(part.name)
+            raise
+
+    return digest.hexdigest(), size, part.name
+
+
+def zip_to_disk(paths, directory, chunk_size=CHUNK_SIZE):
+    """Write files into a temporary zip archive in directory one chunk at a time, returning its path.
+
+    Blocking, run it in an executor. Missing files and repeated names are skipped.
+    """
+
+    names = set()
+    with NamedTemporaryFile(dir=directory, suffix='.zip', delete=False) as archive:
+        try:
+            with ZipFile(archive, 'w') as zf:
+                for path in map(Path, paths):
+                    if path.name in names or not path.exists():
+                        continue
+                    names.add(path.name)
+
+                    info = ZipInfo.from_file(path, path.name)
+                    info.compress_type = ZIP_STORED if path.suffix.lower() in STORED else ZIP_DEFLATED
+                    with open(path, 'rb') as source, zf.open(info, 'w') as target:
+                        copyfileobj(source, target, chunk_size)
+        except BaseException:
+            archive.close()
+            remove(archive.name)
+            raise
+
+    return archive.name
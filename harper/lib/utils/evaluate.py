@@ -0,0 +1,149 @@
+# Builtin modules
+import re
+import ast
+import math
+import operator
+
+MAX_LENGTH = 200
+# Largest result in bits, a 1000 bit integer still converts to a float for display
+MAX_BITS = 1000
+
+OPERATORS = {ast.Add: operator.add,
+             ast.Sub: operator.sub,
+             ast.Mult: operator.mul,
+             ast.Div: operator.truediv,
+             ast.FloorDiv: operator.floordiv,
+             ast.Mod: operator.mod,
+             ast.Pow: operator.pow,
+             ast.USub: operator.neg,
+             ast.UAdd: operator.pos}
+
+FUNCTIONS = {'sqrt': math.sqrt,
+             'sin': math.sin,
+             'cos': math.cos,
+             'tan': math.tan,
+             'asin': math.asin,
+             'acos': math.acos,
+             'atan': math.atan,
+             'log': math.log10,
+             'ln': math.log,
+             'exp': math.exp,
+             'abs': abs,
+             'floor': math.floor,
+             'ceil': math.ceil}
+
+CONSTANTS = {'pi': math.pi,
+             'e': math.e,
+             'tau': math.tau}
+
+# Leading phrases students put in front of the expression itself
+PREAMBLE = re.compile(r'^(what\s+is|what\'s|whats|calculate|compute|evaluate|simplify|solve|find)\s+', re.I)
+
+
+class Unsupported(ValueError):
+    """Raised for anything the local evaluator does not handle"""
+
+
+def clean(question):
+    """Expression text without the question around it"""
+
+    text = ' '.join(question.strip().split())
+    text = PREAMBLE.sub('', text).rstrip('?=. ').replace('^', '**').replace('×', '*').replace('÷', '/')
+    if not text or len(text) > MAX_LENGTH:
+        raise Unsupported(question)
+    return text
+
+
+def evaluate(question):
+    """Value of a plain arithmetic question, raising Unsupported for anything else"""
+
+    try:
+        tree = ast.parse(clean(question), mode='eval')
+    except SyntaxError:
+        raise Unsupported(question)
+
+    try:
+        value = _eval(tree.body)
+    except (ArithmeticError, ValueError, TypeError) as error:
+        # Division by zero, math domain errors and overflow are Wolfram's to explain
+        raise Unsupported(question) from error
+
+    # Float overflow gives inf or nan instead of raising, those are Wolfram's too
+    if isinstance(value, float) and not math.isfinite(value):
+        raise Unsupported(question)
+    return value
+
+
+def bits(value):
+    """Bits in the integer part, which bounds the size of a product"""
+
+    return value.bit_length() if isinstance(value, int) else 0
+
+
+def _eval(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](_eval(node.operand))
+
+    if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        left, right = _eval(node.left), _eval(node.right)
+        # Keep 9**9**9 and friends from tying up the event loop
+        if isinstance(node.op, ast.Pow) and abs(left) > 1 and abs(right) * math.log2(abs(left)) > MAX_BITS:
+            raise Unsupported('power too large')
+        if isinstance(node.op, ast.Mult) and bits(left) + bits(right) > MAX_BITS:
+            raise Unsupported('product too large')
+        return OPERATORS[type(node.op)](left, right)
+
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS
+            and len(node.args) == 1 and not node.keywords):
+        return FUNCTIONS[node.func.id](_eval(node.args[0]))
+
+    raise Unsupported(ast.dump(node))
+
+
+TERM = re.compile(r'([+-])(\d+\.?\d*|\.\d+)?\*?(x(?:\*\*([012]))?)?')
+
+
+def polynomial(text):
+    """(a, b, c) for a polynomial in x of degree two at most"""
+
+    text = text.replace(' ', '').replace('²', '**2')
+    if not text.startswith(('+', '-')):
+        text = '+' + text
+
+    coefficients = [0.0, 0.0, 0.0]
+    position = 0
+    while position < len(text):
+        match = TERM.match(text, position)
+        if match is None or match.end() == position or not (match.group(2) or match.group(3)):
+            raise Unsupported(text)
+
+        sign, number, variable, power = match.groups()
+        value = float(number) if number else 1.0
+        degree = 0 if variable is None else int(power or 1)
+        coefficients[2 - degree] += -value if sign == '-' else value
+        position = match.end()
+
+    return tuple(coefficients)
+
+
+def equation(question):
+    """(a, b, c) of ax^2 + bx + c = 0 from a question in x, raising Unsupported for anything else"""
+
+    text, roots = re.subn(r'^(roots?|zeros?)\s+of\s+', '', clean(question), flags=re.I)
+    text = re.sub(r'\s+for\s+x$', '', text, flags=re.I)
+    # Without an equals sign only "roots of ..." is a question about solving
+    if 'x' not in text or text.count('=') > 1 or not (roots or '=' in text):
+        raise Unsupported(question)
+
+    left, _, right = text.partition('=')
+    a, b, c = polynomial(left)
+    if right:
+        d, e, f = polynomial(right)
+        a, b, c = a - d, b - e, c - f
+    return a, b, c
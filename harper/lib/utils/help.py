@@ -0,0 +1,79 @@
+# 3rd party modules
+import discord
+
+# Cogs left out of the module list
+HIDDEN_COGS = ('errors', 'events')
+
+
+class HelpIndex(object):
+    """Help embeds built once per cog load, keyed by lowercase cog name, command name and alias"""
+
+    def __init__(self):
+        self.modules = None
+        self.entries = {}
+
+    def build(self, client):
+        """Rebuild every payload from the currently loaded cogs"""
+
+        modules = discord.Embed(title='🔧 Module List',
+                                description='Do `{prefix}help [module]` for more info on a specific module.')
+        for name, cog in client.cogs.items():
+            if name.lower() not in HIDDEN_COGS:
+                modules.add_field(name=name, value=cog.__doc__, inline=False)
+
+        entries = {}
+        for name, cog in client.cogs.items():
+            for command in cog.get_commands():
+                payload = self.command_payload(command)
+                for key in [command.name, *command.aliases]:
+                    entries.setdefault(key.lower(), ('command', payload))
+
+        # Module names win over command names, as they always have
+        for name, cog in client.cogs.items():
+            entries[name.lower()] = ('cog', self.cog_payload(name, cog))
+
+        self.modules = modules.to_dict()
+        self.entries = entries
+
+    @staticmethod
+    def cog_payload(name, cog):
+        embed = discord.Embed(title=f"🚧 {str(name).title()} Command List",
+                              description=f"**{str(name).title()} - {cog.__doc__}**\nDo `{{prefix}}help [command]` for more info on a command")
+
+        for c in cog.get_commands():
+            if not c.hidden:
+                if c.signature:
+                    embed.add_field(name=f"`{c.qualified_name} {c.signature}`", value=f"{c.help}", inline=False)
+                else:
+                    embed.add_field(name=f"`{c.qualified_name}`", value=f"{c.help}", inline=False)
+        return embed.to_dict()
+
+    @staticmethod
+    def command_payload(c):
+        embed = discord.Embed(title='🔧 Command Syntax',
+                              description='H.A.R.P.E.R.\'s commands and how to use them.')
+        embed.add_field(name=f"{c.name} - {c.help}",
+                        value=f"Proper Syntax:\n`{c.qualified_name} {c.signature}`",
+                        inline=False)
+        embed.add_field(name='Command Aliases',
+                        value=', '.join(alias for alias in c.aliases if alias) or 'No Aliases',
+                        inline=False)
+        return embed.to_dict()
+
+    @staticmethod
+    def render(payload, prefix):
+        """Fresh Embed for a cached payload, with the guild's prefix filled in"""
+
+        payload = dict(payload)
+        payload['description'] = payload['description'].replace('{prefix}', prefix)
+        return discord.Embed.from_dict(payload)
+
+    def lookup(self, name, prefix):
+        """(kind, embed) for a cog, command or alias, or None"""
+
+        entry = self.entries.get(name.lower())
+        if entry is None:
+            return None
+
+        kind, payload = entry
+        return kind, self.render(payload, prefix)
@@ -0,0 +1,61 @@
+# Builtin modules
+from time import perf_counter
+from importlib import import_module
+
+# Seconds spent importing each module, filled in as modules load
+timings = {}
+# One proxy per module name, so reloading a cog reuses its proxies
+_registry = {}
+
+
+class LazyModule(object):
+    """Module proxy that only imports the real module on first attribute access"""
+
+    def __init__(self, name, warm=True):
+        self._name = name
+        self._warm = warm
+        self._module = None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+    def _load(self):
+        if self._module is None:
+            start = perf_counter()
+            self._module = import_module(self._name)
+            timings.setdefault(self._name, perf_counter() - start)
+        return self._module
+
+
+def lazy(name, warm=True):
+    """Defer importing a heavy dependency until it is first used, warm=False leaves it out of prewarm"""
+
+    module = _registry.get(name)
+    if module is None:
+        module = _registry[name] = LazyModule(name, warm)
+    else:
+        module._warm = warm
+    return module
+
+
+def prewarm():
+    """Import every registered lazy module, meant to run in a worker thread after on_ready"""
+
+    for module in list(_registry.values()):
+        if module._warm:
+            module._load()
+
+
+def record(name, seconds):
+    timings[name] = seconds
+
+
+def report():
+    """Import times, slowest first"""
+
+    rows = sorted(timings.items(), key=lambda item: item[1], reverse=True)
+    return '\n'.join(f"{seconds * 1000:>9.1f} ms  {name}" for name, seconds in rows)
@@ -0,0 +1,137 @@
+# Builtin modules
+import sys
+import json
+import atexit
+import logging
+from os import makedirs, path
+from queue import SimpleQueue
+from time import monotonic
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_PATH = 'harper/data/logs/harper.log'
+LOG_BYTES = 5 * 1024**2
+LOG_BACKUPS = 5
+
+# Identical tracebacks are logged once per window, and at most this many tracebacks per second overall
+TRACEBACK_WINDOW = 60.0
+TRACEBACKS_PER_SECOND = 5
+
+CONSOLE_FORMAT = '%(asctime)s %(levelname)-8s %(name)s: %(message)s'
+
+# Attributes every LogRecord has, anything else was passed through extra=
+RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class LoopQueueHandler(QueueHandler):
+    """Queues records for the listener thread without formatting them on the event loop.
+
+    QueueHandler.prepare renders the message and the traceback text up front so
+    records can be pickled. This queue never leaves the process, so only the
+    message is merged and tracebacks are formatted by the listener.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class TracebackFilter(logging.Filter):
+    """De-duplicates and rate limits records carrying a traceback"""
+
+    def __init__(self, window=TRACEBACK_WINDOW, rate=TRACEBACKS_PER_SECOND):
+        super().__init__()
+        self.window = window
+        self.rate = rate
+        # signature -> [time first logged in this window, repeats suppressed since]
+        self.seen = {}
+        self.second = 0.0
+        self.count = 0
+        self.dropped = 0
+
+    @staticmethod
+    def signature(exc_info):
+        """Exception type and where it was raised"""
+
+        kind, _, tb = exc_info
+        if tb is None:
+            return kind, None
+
+        # Runs on the event loop, so follow the links instead of extract_tb, which reads source lines
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        return kind, (tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+
+    def filter(self, record):
+        if not record.exc_info or record.exc_info[0] is None:
+            return True
+
+        now = monotonic()
+        key = self.signature(record.exc_info)
+        entry = self.seen.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            entry[1] += 1
+            return False
+
+        if now - self.second >= 1:
+            self.second, self.count = now, 0
+        if self.count >= self.rate:
+            self.dropped += 1
+            return False
+        self.count += 1
+
+        if entry is not None and entry[1]:
+            record.msg = f"{record.getMessage()} ({entry[1]} identical tracebacks suppressed)"
+            record.args = None
+        self.seen[key] = [now, 0]
+
+        if len(self.seen) > 1000:
+            self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including anything passed through extra="""
+
+    def format(self, record):
+        data = {'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage()}
+        data.update((key, value) for key, value in vars(record).items() if key not in RESERVED)
+        if record.exc_info:
+            data['traceback'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def setup_logging(level=logging.INFO, filename=LOG_PATH):
+    """Route all logging through a queue to a console and rotating file writer thread"""
+
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [console]
+
+    if filename is not None:
+        makedirs(path.dirname(filename), exist_ok=True)
+        file = RotatingFileHandler(filename, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+        file.setFormatter(JSONFormatter())
+        handlers.append(file)
+
+    queue = SimpleQueue()
+    handler = LoopQueueHandler(queue)
+    handler.addFilter(TracebackFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,84 @@
+# 3rd party modules
+import discord
+
+# Builtin modules
+from time import monotonic
+from collections import OrderedDict
+
+POLICIES = ('full', 'none', 'active', 'ttl')
+
+
+class MemberCache(object):
+    """Member cache policy.
+
+    full   - discord.py's own member cache, every member of every guild
+    none   - no members cached at all
+    active - only the most recent message authors, up to maxsize
+    ttl    - only message authors seen within the last ttl seconds
+    """
+
+    def __init__(self, policy='full', maxsize=10000, ttl=3600):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown member cache policy {policy!r}, expected one of {', '.join(POLICIES)}")
+
+        self.policy = policy
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # (guild id, member id) -> (member, last seen), least recently seen first
+        self._seen = OrderedDict()
+
+    @property
+    def exact(self):
+        """Whether every member is cached, so unique users can be counted"""
+
+        return self.policy == 'full'
+
+    def flags(self, intents):
+        if self.policy == 'full':
+            return discord.MemberCacheFlags.from_intents(intents)
+        return discord.MemberCacheFlags.none()
+
+    def options(self, intents):
+        """Keyword arguments for the Bot constructor"""
+
+        return {'member_cache_flags': self.flags(intents),
+                'chunk_guilds_at_startup': self.policy == 'full' and intents.members}
+
+    def seen(self, member):
+        """Keep a message author cached under the active and ttl policies"""
+
+        if self.policy not in ('active', 'ttl') or not isinstance(member, discord.Member):
+            return
+
+        key = (member.guild.id, member.id)
+        if key not in self._seen:
+            member.guild._add_member(member)
+        self._seen[key] = (member, monotonic())
+        self._seen.move_to_end(key)
+
+        while len(self._seen) > self.maxsize:
+            self._forget(*self._seen.popitem(last=False))
+
+    def expire(self):
+        """Drop authors not seen within the ttl, returning how many were removed"""
+
+        if self.policy != 'ttl':
+            return 0
+
+        cutoff = monotonic() - self.ttl
+        removed = 0
+        while self._seen:
+            key, (member, seen) = next(iter(self._seen.items()))
+            if seen >= cutoff:
+                break
+            self._forget(*self._seen.popitem(last=False))
+            removed += 1
+        return removed
+
+    @staticmethod
+    def _forget(key, entry):
+        member, _ = entry
+        member.guild._remove_member(member)
+
+    def __len__(self):
+        return len(self._seen)
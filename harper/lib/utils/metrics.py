@@ -0,0 +1,330 @@
+# 3rd party modules
+from aiohttp import web
+
+# Builtin modules
+from math import log, ceil, inf
+from time import time, perf_counter
+from asyncio import sleep, current_task
+from logging import getLogger
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from collections import deque, namedtuple, defaultdict, Counter
+
+# Local modules
+from harper.lib.utils.lazy import lazy
+
+psutil = lazy('psutil')
+
+# Not log, which is math.log here
+logger = getLogger(__name__)
+
+# Local metrics endpoint
+HOST = '127.0.0.1'
+PORT = 9185
+
+# Invocation of the command running in the current task, if any
+current = ContextVar('current_invocation', default=None)
+
+Sample = namedtuple('Sample', 'time cpu_percent cpu_time rss memory_total memory_percent loop_lag latency guilds users')
+
+# name, type, help text, sample field
+METRICS = [('harper_process_cpu_percent', 'gauge', 'Process CPU usage since the previous sample', 'cpu_percent'),
+           ('harper_process_cpu_seconds_total', 'counter', 'Process user and system CPU time', 'cpu_time'),
+           ('harper_process_resident_memory_bytes', 'gauge', 'Process resident set size', 'rss'),
+           ('harper_process_memory_percent', 'gauge', 'Process share of total system memory', 'memory_percent'),
+           ('harper_event_loop_lag_seconds', 'gauge', 'Delay before the event loop ran the sampler again', 'loop_lag'),
+           ('harper_websocket_latency_seconds', 'gauge', 'Discord websocket heartbeat latency', 'latency'),
+           ('harper_guilds', 'gauge', 'Servers the bot is in', 'guilds'),
+           ('harper_users', 'gauge', 'Unique users across all servers', 'users')]
+
+
+class Sampler(object):
+    """Process metrics sampled on a schedule into a fixed-size ring buffer"""
+
+    def __init__(self, client, size=720):
+        self.client = client
+        self.samples = deque(maxlen=size)
+        self._process = None
+
+    @property
+    def process(self):
+        if self._process is None:
+            self._process = psutil.Process()
+            # The first cpu_percent call only primes the counter
+            self._process.cpu_percent()
+        return self._process
+
+    @property
+    def started(self):
+        return self.process.create_time()
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    async def sample(self):
+        """Take one sample and append it to the ring buffer"""
+
+        start = perf_counter()
+        await sleep(0)
+        loop_lag = perf_counter() - start
+
+        with self.process.oneshot():
+            cpu_times = self.process.cpu_times()
+            sample = Sample(time=time(),
+                            cpu_percent=self.process.cpu_percent(),
+                            cpu_time=cpu_times.user + cpu_times.system,
+                            rss=self.process.memory_info().rss,
+                            memory_total=psutil.virtual_memory().total,
+                            memory_percent=self.process.memory_percent(),
+                            loop_lag=loop_lag,
+                            latency=self.client.latency,
+                            guilds=self.client.counter.guilds,
+                            users=self.client.counter.users)
+
+        self.samples.append(sample)
+        return sample
+
+    def exposition(self):
+        """Latest sample in the Prometheus text format"""
+
+        sample = self.latest
+        if sample is None:
+            return ''
+
+        lines = []
+        for name, kind, description, field in METRICS:
+            lines += gauge(name, description, getattr(sample, field), kind)
+
+        db = getattr(self.client, 'db', None)
+        if db is not None:
+            stats = db.stats()
+            lines += gauge('harper_db_read_queue_depth', 'Reads waiting for a pooled connection', stats['read_queue_depth'])
+            lines += gauge('harper_db_pending_writes', 'Writes waiting for their group commit', stats['pending_writes'])
+            lines += summary('harper_db_read_seconds', 'Database read latency including queueing', stats['read_latency'])
+            lines += summary('harper_db_write_seconds', 'Database write latency including the group commit', stats['write_latency'])
+
+        prefilter = getattr(self.client, 'prefilter', None)
+        if prefilter is not None:
+            stats = prefilter.stats()
+            lines += gauge('harper_messages_checked_total', 'Messages checked for a command prefix', stats['checked'], 'counter')
+            lines += gauge('harper_messages_rejected_total', 'Messages rejected as non-commands before process_commands', stats['rejected'], 'counter')
+
+        wolfram = getattr(self.client, 'wolfram', None)
+        if wolfram is not None:
+            stats = wolfram.stats()
+            lines += gauge('harper_wolfram_local_total', 'Wolfram questions answered in-process', stats['local'], 'counter')
+            lines += gauge('harper_wolfram_queries_total', 'Wolfram questions passed to the Wolfram|Alpha client', stats['queries'], 'counter')
+            lines += gauge('harper_wolfram_local_ratio', 'Share of Wolfram questions answered in-process', stats['local_fraction'])
+
+        watchdog = getattr(self.client, 'watchdog', None)
+        if watchdog is not None:
+            stats = watchdog.stats()
+            lines += gauge('harper_loop_stalls_total', 'Event loop stalls longer than the watchdog threshold', stats['stalls'], 'counter')
+            lines += summary('harper_loop_lag_seconds', 'Event loop lag measured by the watchdog heartbeat', stats['lag'])
+
+        dispatcher = getattr(self.client, 'dispatcher', None)
+        if dispatcher is not None:
+            stats = dispatcher.stats()
+            lines += gauge('harper_send_queue_depth', 'Outbound messages waiting to be sent', stats['queued'])
+            lines += gauge('harper_send_coalesced_total', 'Outbound messages merged into a newer one', stats['coalesced'], 'counter')
+            lines += gauge('harper_send_dropped_total', 'Outbound messages dropped as stale', stats['dropped'], 'counter')
+            lines += summary('harper_send_queue_seconds', 'Time from queueing to sending an outbound message', stats['latency'])
+        return '\n'.join(lines) + '\n'
+
+
+def gauge(name, description, value, kind='gauge'):
+    return [f"# HELP {name} {description}",
+            f"# TYPE {name} {kind}",
+            f"{name} {float(value)!r}"]
+
+
+def summary(name, description, stats):
+    """Prometheus summary lines from Histogram.summary()"""
+
+    return [f"# HELP {name} {description}",
+            f"# TYPE {name} summary",
+            f"{name}{{quantile=\"0.5\"}} {stats['p50']!r}",
+            f"{name}{{quantile=\"0.95\"}} {stats['p95']!r}",
+            f"{name}{{quantile=\"0.99\"}} {stats['p99']!r}",
+            f"{name}_sum {stats['mean'] * stats['count']!r}",
+            f"{name}_count {stats['count']}"]
+
+
+class MetricsServer(object):
+    """Local HTTP server exposing /metrics"""
+
+    def __init__(self, sampler, host=HOST, port=PORT):
+        self.sampler = sampler
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def metrics(self, request):
+        return web.Response(text=self.sampler.exposition(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Prometheus-Format': '0.0.4'})
+
+    async def start(self):
+        if self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as error:
+            # Metrics are optional, a port in use must not stop on_ready
+            logger.warning('Metrics disabled, cannot listen on %s:%s: %s', self.host, self.port, error)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info('Serving metrics on http://%s:%s/metrics', self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class Histogram(object):
+    """Streaming histogram with logarithmic buckets, each quantile is within about 1%"""
+
+    def __init__(self, precision=0.01):
+        self._base = 1 + 2 * precision
+        self._log_base = log(self._base)
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = inf
+        self.max = 0.0
+
+    def record(self, value):
+        value = max(value, 1e-9)
+        self.buckets[ceil(log(value) / self._log_base)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Midpoint of the bucket, clamped to what was actually observed
+                value = self._base ** index * 2 / (1 + self._base)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'min': self.min if self.count else 0.0,
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99)}
+
+    def export(self):
+        """Summary plus the raw buckets as (upper bound, count) pairs"""
+
+        data = self.summary()
+        data['buckets'] = [(self._base ** index, self.buckets[index]) for index in sorted(self.buckets)]
+        return data
+
+
+class Invocation(object):
+    """Timing state for one command invocation"""
+
+    __slots__ = ('command', 'cog', 'started', 'db_time')
+
+    def __init__(self, command, cog):
+        self.command = command
+        self.cog = cog
+        self.started = perf_counter()
+        self.db_time = 0.0
+
+
+@asynccontextmanager
+async def timed_db():
+    """Charge the time spent inside the block to the running command's database wait"""
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        invocation = current.get()
+        if invocation is not None:
+            invocation.db_time += perf_counter() - start
+
+
+class Telemetry(object):
+    """Per-command and per-cog latency histograms, error counts and cooldown rejections"""
+
+    def __init__(self):
+        self.commands = defaultdict(Histogram)
+        self.cogs = defaultdict(Histogram)
+        self.db = defaultdict(Histogram)
+        self.errors = Counter()
+        self.cooldowns = Counter()
+        # Invocations by task, so other threads can see what the loop is running
+        self.running = {}
+
+    def before_invoke(self, ctx):
+        cog = ctx.cog.qualified_name if ctx.cog else 'No Category'
+        invocation = Invocation(ctx.command.qualified_name, cog)
+        current.set(invocation)
+        self.running[current_task()] = invocation
+
+    def after_invoke(self, ctx):
+        invocation = current.get()
+        self.running.pop(current_task(), None)
+        if invocation is None:
+            return
+
+        elapsed = perf_counter() - invocation.started
+        self.commands[invocation.command].record(elapsed)
+        self.cogs[invocation.cog].record(elapsed)
+        self.db[invocation.command].record(invocation.db_time)
+        current.set(None)
+
+    def error(self, ctx, cooldown=False):
+        name = ctx.command.qualified_name if ctx.command else 'unknown'
+        if cooldown:
+            self.cooldowns[name] += 1
+        else:
+            self.errors[name] += 1
+
+    def table(self):
+        """Plain text table of command timings in milliseconds"""
+
+        rows = [f"{'command':<16}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'db p95':>9}{'err':>6}{'cd':>6}"]
+        for name in sorted(set(self.commands) | set(self.errors) | set(self.cooldowns)):
+            stats = self.commands[name].summary() if name in self.commands else Histogram().summary()
+            db = self.db[name].quantile(0.95) if name in self.db else 0.0
+            rows.append(f"{name[:15]:<16}{stats['count']:>7,}"
+                        f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}"
+                        f"{db * 1000:>9.1f}{self.errors[name]:>6,}{self.cooldowns[name]:>6,}")
+
+        rows.append('')
+        for name in sorted(self.cogs):
+            stats = self.cogs[name].summary()
+            rows.append(f"{('cog ' + name)[:15]:<16}{stats['count']:>7,}"
+                        f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}")
+        return '\n'.join(rows)
+
+    def export(self):
+        """Everything recorded, in seconds, for offline analysis"""
+
+        return {'time': time(),
+                'commands': {name: h.export() for name, h in self.commands.items()},
+                'cogs': {name: h.export() for name, h in self.cogs.items()},
+                'db': {name: h.export() for name, h in self.db.items()},
+                'errors': dict(self.errors),
+                'cooldowns': dict(self.cooldowns)}
@@ -0,0 +1,26 @@
+# Builtin modules
+from pathlib import Path
+
+
+async def migrate(db, directory):
+    """Apply every NNN_name.sql script newer than the recorded schema version, once each"""
+
+    await db.execute('CREATE TABLE IF NOT EXISTS schema_version (version integer PRIMARY KEY, name text, applied_at text)')
+    cur = await db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    current, = await cur.fetchone()
+    await cur.close()
+
+    applied = []
+    for path in sorted(Path(directory).glob('*.sql')):
+        version = int(path.stem.split('_', 1)[0])
+        if version <= current:
+            continue
+
+        # One transaction per migration so a failing script leaves no trace
+        name = path.stem.replace("'", "''")
+        await db.executescript(f"BEGIN;\n{path.read_text(encoding='utf-8')};\n"
+                               f"INSERT INTO schema_version (version, name, applied_at) VALUES ({version}, '{name}', datetime('now'));\n"
+                               f"COMMIT;")
+        applied.append(path.stem)
+
+    return applied
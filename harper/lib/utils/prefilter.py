@@ -0,0 +1,65 @@
+# Local modules
+from harper.lib.utils.cache import MISSING
+
+
+class PrefixFilter(object):
+    """Synchronous check that a message could be a command, run before process_commands.
+
+    The first-character table is shared with the prefix cache, which adds the first
+    character of every custom prefix it reads or saves, even ones it later evicts.
+    Together with the mention forms and the default prefix, a message starting with
+    anything else cannot be a command in any guild. Past that, a guild whose
+    prefix is in the cache is matched exactly and one that is not is let through
+    for get_prefix to decide.
+    """
+
+    def __init__(self, prefixes, dm_prefix='.'):
+        self.prefixes = prefixes
+        self.dm_prefix = dm_prefix
+        self.mentions = ()
+        self.first = prefixes.first
+        self.first.update(('<', prefixes.default[:1], dm_prefix[:1]))
+        self.checked = 0
+        self.rejected = 0
+
+    def set_user(self, user):
+        """Mention forms for the bot's user, once it is known"""
+
+        self.mentions = (f"<@{user.id}>", f"<@!{user.id}>")
+
+    def is_mention(self, content):
+        """A message that is nothing but a mention of the bot"""
+
+        return content in self.mentions
+
+    def check(self, message):
+        """False when the message cannot start with a prefix, without awaiting anything"""
+
+        self.checked += 1
+        content = message.content
+        if not content or content[0] not in self.first:
+            self.rejected += 1
+            return False
+
+        if not self.mentions or content.startswith(self.mentions):
+            return True
+
+        if message.guild is None:
+            prefix = self.dm_prefix
+        else:
+            prefix = self.prefixes.get(message.guild.id, MISSING)
+            if prefix is MISSING:
+                if not self.prefixes.complete:
+                    return True
+                prefix = self.prefixes.default
+
+        if content.startswith(prefix):
+            return True
+
+        self.rejected += 1
+        return False
+
+    def stats(self):
+        return {'checked': self.checked,
+                'rejected': self.rejected,
+                'passed': self.checked - self.rejected}
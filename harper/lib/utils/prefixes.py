@@ -0,0 +1,61 @@
+# Local modules
+from harper.lib.utils.cache import LRUCache, MISSING
+
+
+class PrefixCache(LRUCache):
+    """Guild prefix cache, bulk loaded from the prefixes table"""
+
+    def __init__(self, default='.', maxsize=10000):
+        super().__init__(maxsize=maxsize)
+        self.default = default
+        # True while every custom prefix in the table is held in memory,
+        # so a miss means the guild uses the default prefix.
+        self.complete = False
+        # First character of every custom prefix read from the database, kept through
+        # clears and evictions so the prefix filter never rejects a guild it has not cached
+        self.first = set()
+
+    async def load(self, db):
+        """Bulk load every custom prefix"""
+
+        rows = await db.fetchall('SELECT id, prefix FROM prefixes')
+
+        self.clear()
+        self.complete = True
+        for guild_id, prefix in rows:
+            self.first.add(prefix[:1])
+            self.put(guild_id, prefix)
+
+    async def fetch(self, db, guild_id):
+        """Prefix for a guild, only querying the database for evicted guilds"""
+
+        prefix = self.get(guild_id, MISSING)
+        if prefix is not MISSING:
+            return prefix
+        if self.complete:
+            return self.default
+
+        row = await db.fetchone('SELECT prefix FROM prefixes WHERE id = ?', (guild_id,))
+
+        prefix = row[0] if row else self.default
+        self.first.add(prefix[:1])
+        self.put(guild_id, prefix)
+        return prefix
+
+    def update(self, guild_id, prefix):
+        """Write-through after a custom prefix is saved"""
+
+        self.first.add(prefix[:1])
+        self.put(guild_id, prefix)
+
+    def reset(self, guild_id):
+        """Write-through after a custom prefix is deleted"""
+
+        if self.complete:
+            self.pop(guild_id)
+        else:
+            self.put(guild_id, self.default)
+
+    def _evict(self):
+        super()._evict()
+        self.complete = False
@@ -0,0 +1,80 @@
+# 3rd party modules
+import discord
+
+# Builtin modules
+from math import inf
+from time import monotonic
+from asyncio import ensure_future, get_event_loop
+
+# Seconds between presence updates, the gateway allows about five a minute
+PRESENCE_INTERVAL = 15.0
+
+
+class Presence(object):
+    """Bot status that is only recomputed and sent when its inputs change"""
+
+    def __init__(self, client, template, interval=PRESENCE_INTERVAL):
+        self.client = client
+        self._template = template
+        self.interval = interval
+        self.sent = None
+        self.updates = 0
+        self.skipped = 0
+        self._last = -inf
+        self._handle = None
+
+    @property
+    def template(self):
+        return self._template
+
+    @template.setter
+    def template(self, value):
+        self._template = value
+        self.invalidate()
+
+    @property
+    def status(self):
+        """Status formatter"""
+
+        return self._template.format(guilds=self.client.counter.guilds, users=self.client.counter.users, version=self.client.version)
+
+    def invalidate(self):
+        """An input changed, schedule one update no sooner than the interval allows"""
+
+        if self._handle is not None:
+            return
+
+        delay = max(0.0, self._last + self.interval - monotonic())
+        self._handle = get_event_loop().call_later(delay, lambda: ensure_future(self.flush()))
+
+    def reset(self):
+        """A new gateway session starts without a status, so send it again even if unchanged"""
+
+        self.sent = None
+        self.invalidate()
+
+    async def flush(self):
+        """Send the current status unless the gateway already has it"""
+
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        status = self.status
+        if status == self.sent:
+            self.skipped += 1
+            return
+
+        try:
+            _type, _name = status.split(' ', maxsplit=1)
+
+        except ValueError:
+            _type = 'watching'
+            _name = status
+
+        self._last = monotonic()
+        await self.client.change_presence(activity=discord.Activity(name=_name,
+        type=getattr(discord.ActivityType, _type, discord.ActivityType.watching),
+        ))
+        self.sent = status
+        self.updates += 1
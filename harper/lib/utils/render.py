@@ -0,0 +1,69 @@
+# 3rd party modules
+from discord.ext import commands
+
+# Builtin modules
+from asyncio import get_event_loop, gather
+from functools import partial
+from importlib import import_module
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+
+class RendererBusy(commands.CommandError):
+    """Raised when the render queue is full"""
+
+    def __init__(self):
+        super().__init__('Too many graphs are being drawn right now, please try again in a few seconds.')
+
+
+def preload(modules=(), warmup=None):
+    """Worker initializer, imports what renders need and draws once before the first render arrives"""
+
+    for module in modules:
+        import_module(module)
+    if warmup is not None:
+        warmup()
+
+
+class Renderer(object):
+    """Process pool for CPU bound rendering, off the event loop"""
+
+    def __init__(self, workers=2, max_pending=8, modules=(), warmup=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.modules = tuple(modules)
+        self.warmup = warmup
+        self.pending = 0
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # Forking while another thread holds the import lock (pre-warming) deadlocks the workers
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'),
+                                             initializer=preload, initargs=(self.modules, self.warmup))
+        return self._pool
+
+    async def warm(self):
+        """Start the workers ahead of the first render, spawned workers import everything from scratch"""
+
+        # The pool only starts a worker when a task finds none idle, so submit one task per worker at once
+        loop = get_event_loop()
+        await gather(*(loop.run_in_executor(self.pool, preload) for _ in range(self.workers)))
+
+    async def render(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a worker process, refusing work once the queue is full"""
+
+        if self.pending >= self.max_pending:
+            raise RendererBusy()
+
+        self.pending += 1
+        try:
+            return await get_event_loop().run_in_executor(self.pool, partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,172 @@
+# Builtin modules
+import sys
+import asyncio
+import logging
+from os import sep
+from time import time, monotonic
+from threading import Thread, Event, get_ident
+from traceback import extract_stack
+from collections import deque
+
+# Local modules
+from harper.lib.utils.metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+# Loop lag that counts as a stall, and how often the loop checks in
+THRESHOLD = 0.25
+INTERVAL = 0.05
+# Callbacks asyncio reports as slow in debug mode. Debug mode checks every call_soon
+# and coroutine, so it is off unless chasing something the stack samples miss
+SLOW_CALLBACK = 0.1
+SLOW_CALLBACKS = False
+
+STACK_DEPTH = 30
+REPO = f"{sep}harper{sep}lib{sep}"
+
+
+class Stall(object):
+    """One stretch of the event loop not getting back to the watchdog in time"""
+
+    __slots__ = ('time', 'duration', 'command', 'cog', 'where', 'stack')
+
+    def __init__(self, duration, command, cog, where, stack):
+        self.time = time()
+        self.duration = duration
+        self.command = command
+        self.cog = cog
+        self.where = where
+        self.stack = stack
+
+
+class SlowCallbackHandler(logging.Handler):
+    """Keeps asyncio's slow callback warnings, which only exist in debug mode"""
+
+    def __init__(self, slow):
+        super().__init__(logging.WARNING)
+        self.slow = slow
+
+    def emit(self, record):
+        if record.msg.startswith('Executing') and record.args:
+            handle, duration = record.args[0], record.args[-1]
+            self.slow.append((time(), duration, str(handle)[:200]))
+
+
+class Watchdog(object):
+    """Event loop lag monitor.
+
+    A heartbeat task on the loop checks in every INTERVAL. A sampler thread watches
+    the heartbeat, and once it is more than the threshold late it captures the
+    loop thread's stack while the loop is still blocked. The stall is blamed on the
+    command running in the loop's current task and on the innermost frame inside
+    the bot's own code.
+    """
+
+    def __init__(self, telemetry, threshold=THRESHOLD, interval=INTERVAL, size=50, slow_callback=SLOW_CALLBACK):
+        self.telemetry = telemetry
+        self.threshold = threshold
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.stalls = deque(maxlen=size)
+        self.slow = deque(maxlen=size)
+        self.lag = Histogram()
+        self.count = 0
+        self.beat = None
+        self.loop = None
+        self.thread_id = None
+        self._open = None
+        self._task = None
+        self._stop = Event()
+
+    def start(self, loop=None):
+        """Start watching, from the event loop's own thread"""
+
+        if self._task is not None:
+            return
+
+        self.loop = loop or asyncio.get_event_loop()
+        self.thread_id = get_ident()
+        self.beat = monotonic()
+
+        if SLOW_CALLBACKS:
+            self.loop.slow_callback_duration = self.slow_callback
+            self.loop.set_debug(True)
+            logging.getLogger('asyncio').addHandler(SlowCallbackHandler(self.slow))
+
+        self._task = self.loop.create_task(self.heartbeat())
+        Thread(target=self.sample, name='harper-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+            lag = max(0.0, now - self.beat - self.interval)
+            self.beat = now
+            self.lag.record(lag)
+
+            stall, self._open = self._open, None
+            if stall is not None:
+                # The sampler saw it start, this is how long it really lasted
+                stall.duration = lag
+                log.warning('Event loop blocked for %.0f ms in %s', lag * 1000, stall.where,
+                            extra={'command': stall.command, 'cog': stall.cog, 'lag': lag})
+
+    def sample(self):
+        """Sampler thread, captures the loop thread's stack during a stall"""
+
+        seen = None
+        while not self._stop.wait(self.interval / 2):
+            beat = self.beat
+            late = monotonic() - beat - self.interval
+            if late > self.threshold and beat != seen:
+                seen = beat
+                self.capture(late)
+
+    def capture(self, late):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        stack = extract_stack(frame)[-STACK_DEPTH:]
+        del frame
+        own = [f for f in stack if REPO in f.filename]
+        innermost = own[-1] if own else stack[-1]
+        where = f"{innermost.filename.split(REPO)[-1]}:{innermost.lineno} in {innermost.name}"
+
+        command, cog = self.invocation()
+        self._open = stall = Stall(late, command, cog, where, stack)
+        self.stalls.append(stall)
+        self.count += 1
+
+    def invocation(self):
+        """Command and cog of the task the loop is running right now, read from another thread"""
+
+        # Private, but a plain dict lookup and the only way to see another thread's current task
+        task = asyncio.tasks._current_tasks.get(self.loop)
+        invocation = self.telemetry.running.get(task)
+        if invocation is None:
+            return None, None
+        return invocation.command, invocation.cog
+
+    def lines(self, limit=10):
+        """Recent stalls as message lines, newest first"""
+
+        lines = []
+        # Copied first, the sampler thread may append meanwhile
+        for i, stall in enumerate(reversed(list(self.stalls)), 1):
+            if i > limit:
+                break
+            command = f"`{stall.command}` ({stall.cog})" if stall.command else 'no command'
+            lines.append(f"**{i}.** <t:{stall.time:.0f}:R> **{stall.duration * 1000:,.0f} ms** {command} at `{stall.where}`")
+        return lines
+
+    def stats(self):
+        return {'stalls': self.count,
+                'slow_callbacks': len(self.slow),
+                'lag': self.lag.summary()}
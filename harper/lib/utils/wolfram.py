@@ -0,0 +1,99 @@
+# 3rd party modules
+from aiohttp import ClientSession, ClientTimeout, ClientError, TCPConnector
+from discord.ext import commands
+
+# Builtin modules
+from asyncio import ensure_future, shield, TimeoutError
+
+# Local modules
+from harper.lib.utils.cache import TTLCache, MISSING
+
+API_URL = 'https://api.wolframalpha.com/v2/query'
+
+
+class WolframError(commands.CommandError):
+    """Raised when Wolfram|Alpha has no answer or cannot be reached"""
+
+
+class WolframClient(object):
+    """Async Wolfram|Alpha client with one pooled HTTP session for the bot's lifetime"""
+
+    def __init__(self, app_id, url=API_URL, timeout=10, ttl=3600, maxsize=1024, connections=8):
+        self.app_id = app_id
+        self.url = url
+        self.timeout = timeout
+        self.connections = connections
+        self.cache = TTLCache(ttl, maxsize=maxsize)
+        self._session = None
+        self._inflight = {}
+        # Questions the caller answered itself, against those that came through query
+        self.local = 0
+        self.queries = 0
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(timeout=ClientTimeout(total=self.timeout),
+                                          connector=TCPConnector(limit=self.connections))
+        return self._session
+
+    @staticmethod
+    def normalize(question):
+        return ' '.join(question.lower().split())
+
+    async def query(self, question):
+        """Answer text for a question, sharing one request between identical questions"""
+
+        self.queries += 1
+        key = self.normalize(question)
+        answer = self.cache.get(key, MISSING)
+        if answer is not MISSING:
+            return answer
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = ensure_future(self._fetch(question))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+
+        # Shielded so one cancelled caller does not cancel the request for everyone else
+        return await shield(task)
+
+    def _settle(self, key, task):
+        del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.cache.put(key, task.result())
+
+    async def _fetch(self, question):
+        params = {'appid': self.app_id, 'input': question, 'format': 'plaintext', 'output': 'json'}
+
+        try:
+            async with self.session.get(self.url, params=params) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except TimeoutError:
+            raise WolframError(f"Wolfram|Alpha took longer than {self.timeout} seconds to answer.")
+        except ClientError as error:
+            raise WolframError(f"Could not reach Wolfram|Alpha ({error}).")
+
+        result = data.get('queryresult', {})
+        # Same pods the wolframalpha package exposes as Result.results
+        for pod in result.get('pods', []) if result.get('success') else []:
+            if pod.get('primary') or pod.get('title') == 'Result':
+                for subpod in pod.get('subpods', []):
+                    if subpod.get('plaintext'):
+                        return subpod['plaintext']
+
+        raise WolframError('Wolfram|Alpha does not have an answer for that.')
+
+    def stats(self):
+        total = self.local + self.queries
+        return {'local': self.local,
+                'queries': self.queries,
+                'local_fraction': self.local / total if total else 0.0,
+                'cache': self.cache.stats()}
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -1,7 +1,21 @@
+from argparse import ArgumentParser
+
 from harper.lib.bot import launch
+from harper.lib.bot.cluster import launch_cluster
 
 version = '0.0.0'
 # v[Release].[Major].[Minor].[Patch]
 
 if __name__ == '__main__':
-    launch(version)
\ No newline at end of file
+    parser = ArgumentParser(description='Run H.A.R.P.E.R.')
+    parser.add_argument('--clusters', type=int, default=0, help='run this many sharded worker processes')
+    parser.add_argument('--shards', type=int, default=None, help='total shard count across all clusters')
+    args = parser.parse_args()
+
+    if args.clusters and args.shards is not None and args.shards < args.clusters:
+        parser.error('--shards must be at least --clusters, every cluster needs a shard')
+
+    if args.clusters:
+        launch_cluster(version, args.clusters, args.shards or args.clusters)
+    else:
+        launch(version)
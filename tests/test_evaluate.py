@@ -0,0 +1,106 @@
+import math
+
+import pytest
+
+from harper.lib.utils.evaluate import Unsupported, evaluate, equation, polynomial
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('2+2', 4),
+    ('what is 3^2*4?', 36),
+    ('calculate 7 × 6', 42),
+    ('10 ÷ 4', 2.5),
+    ('-(3 - 5)', 2),
+    ('2**10', 1024),
+    ('17 // 5 + 17 % 5', 5),
+    ('sqrt(16) + abs(-2)', 6.0),
+    ('2 * pi', math.tau),
+    ('ln(e)', 1.0),
+    ('log(1000)', 3.0),
+    ('2**1000', 2**1000),
+    ('1**(10**100)', 1),
+    ('(-1)**(2**900)', 1),
+])
+def test_evaluate(question, expected):
+    assert evaluate(question) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('question', [
+    '',
+    'x + 1',
+    'hello world',
+    '__import__("os")',
+    '(1).__class__',
+    '[1, 2, 3]',
+    'sqrt(4, 2)',
+    'sqrt(x=4)',
+    'open("file")',
+    '"a" * 3',
+    '1 / 0',
+    'sqrt(-1)',
+    'log(0)',
+    'exp(1000)',
+    '1e308 * 10',
+    '1e308 * 10 - 1e308 * 10',
+    '1' * 201,
+])
+def test_evaluate_unsupported(question):
+    with pytest.raises(Unsupported):
+        evaluate(question)
+
+
+@pytest.mark.parametrize('question', [
+    '9**9**9',
+    '(9**999)**999',
+    '(10**1000)**1000',
+    '((10**1000)**1000)**1000',
+    '2**1001',
+    '(2**600)*(2**600)',
+    '10**400',
+    '0.5**-5000',
+])
+def test_evaluate_rejects_huge_results(question):
+    with pytest.raises(Unsupported):
+        evaluate(question)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('x**2-5x+6', (1.0, -5.0, 6.0)),
+    ('-x', (0.0, -1.0, 0.0)),
+    ('3', (0.0, 0.0, 3.0)),
+    ('2x²+x', (2.0, 1.0, 0.0)),
+    ('0.5x**2 + .25x - 1', (0.5, 0.25, -1.0)),
+    ('x+x+x**1', (0.0, 3.0, 0.0)),
+])
+def test_polynomial(text, expected):
+    assert polynomial(text) == expected
+
+
+@pytest.mark.parametrize('text', ['x**3', 'y+1', '2x+', '', '+', 'x*y'])
+def test_polynomial_unsupported(text):
+    with pytest.raises(Unsupported):
+        polynomial(text)
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('x^2-5x+6=0', (1.0, -5.0, 6.0)),
+    ('solve x^2 = 4', (1.0, 0.0, -4.0)),
+    ('2x + 3 = x - 1', (0.0, 1.0, 4.0)),
+    ('roots of x^2 - 1', (1.0, 0.0, -1.0)),
+    ('zeros of 3x^2 + 2x', (3.0, 2.0, 0.0)),
+    ('solve 2x = 0 for x', (0.0, 2.0, 0.0)),
+])
+def test_equation(question, expected):
+    assert equation(question) == expected
+
+
+@pytest.mark.parametrize('question', [
+    'x^2 - 1',
+    '2 + 2 = 4',
+    'x = 1 = 2',
+    'x^3 = 8',
+    'sin(x) = 0',
+])
+def test_equation_unsupported(question):
+    with pytest.raises(Unsupported):
+        equation(question)